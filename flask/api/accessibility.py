@@ -0,0 +1,325 @@
+# Memoization of `calculate_accessibility`, which recomputes the whole network for every
+# request. Users toggle the same projects on and off, so most project sets recur, and
+# a shared link is often opened by several people at once, so identical requests that
+# overlap wait for a single computation rather than each running their own. A set one
+# toggle away from a cached one can be derived from it, recomputing only the origins the
+# toggled project can affect.
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import inspect
+import os
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# {metric: {origin_id: score}}, as returned by `calculate_accessibility`
+AccessibilityResults = Dict[str, Dict[int, float]]
+
+ACCESSIBILITY_METRICS = ["job", "populations"]
+
+
+def canonical_project_ids(project_ids: Iterable[int]) -> Tuple[int, ...]:
+    """The same project set always maps to the same ids, whatever order they were asked for in"""
+    return tuple(sorted(set(project_ids)))
+
+
+def takes_origin_ids(engine: Callable) -> bool:
+    """Whether an engine can compute a subset of origins, which incremental recomputation needs"""
+    return "origin_ids" in inspect.signature(engine).parameters
+
+
+def toggled_project(base_ids: Iterable[int], project_ids: Iterable[int]) -> int | None:
+    """The project two sets differ by, `None` unless they differ by exactly one"""
+    difference = set(base_ids) ^ set(project_ids)
+    return next(iter(difference)) if len(difference) == 1 else None
+
+
+def merge_recomputed(
+    base: AccessibilityResults,
+    origin_ids: Iterable[int],
+    recomputed: AccessibilityResults,
+) -> AccessibilityResults:
+    """
+    Derive a set's results from those of a set one project away. Origins out of the
+    toggled project's reach score the same under both sets, so theirs are kept, and those
+    of the origins in reach are replaced by their recomputed scores.
+
+        Args
+            base (`AccessibilityResults`): the results of the nearby set
+            origin_ids (`Iterable[int]`): the origins in reach of the toggled project
+            recomputed (`AccessibilityResults`): the results of only those origins, under the new set
+
+        Returns
+            `AccessibilityResults`
+    """
+    origin_ids = set(origin_ids)
+    return {
+        metric: {
+            **{
+                origin_id: score
+                for origin_id, score in scores.items()
+                if origin_id not in origin_ids
+            },
+            **recomputed.get(metric, {}),
+        }
+        for metric, scores in base.items()
+    }
+
+
+class AccessibilityCache:
+    """
+    Results keyed by project set and data version, in two tiers: a bounded LRU held
+    by this process, in front of a store shared by the workers, e.g. the app's
+    filesystem cache, which outlives restarts
+
+        Args
+            store (`Any`): the shared tier, anything with a cachelib-style `get` and `set`
+            max_entries (`int`): how many results the in-process tier holds
+            lock_dir (`str | None`): where the lock files that coalesce computations across
+                processes go, defaults to only coalescing within this process
+    """
+
+    def __init__(self, store: Any, max_entries: int, lock_dir: str | None = None):
+        self.store = store
+        self.max_entries = max_entries
+        self.lock_dir = lock_dir
+        self._memory: OrderedDict[str, AccessibilityResults] = OrderedDict()
+        # key => (version, project ids) of the entries in memory
+        self._sets: Dict[str, Tuple[int, Tuple[int, ...]]] = {}
+        self._lock = Lock()
+        self._stats: Counter = Counter()
+        # key => (lock, number of holders and waiters)
+        self._flights: Dict[str, Tuple[Lock, int]] = {}
+
+    @staticmethod
+    def key(project_ids: Tuple[int, ...], version: int):
+        digest = hashlib.sha256(",".join(map(str, project_ids)).encode()).hexdigest()
+        return f"accessibility-v{version}-{digest}"
+
+    def get(
+        self,
+        project_ids: Iterable[int],
+        version: int,
+        compute: Callable[[List[int]], AccessibilityResults],
+    ) -> AccessibilityResults:
+        """
+        Look up a project set's results, computing and storing them on a miss. The results
+        are shared between callers, so they must not be modified.
+
+            Args
+                project_ids (`Iterable[int]`): the projects, in any order
+                version (`int`): the data version the results are computed from
+                compute (`Callable[[List[int]], AccessibilityResults]`): computes the results of the sorted project ids
+
+            Returns
+                `AccessibilityResults`
+        """
+        results = self.peek(project_ids, version)
+
+        if results is not None:
+            return results
+
+        return self.compute(project_ids, version, compute)
+
+    def compute(
+        self,
+        project_ids: Iterable[int],
+        version: int,
+        compute: Callable[[List[int]], AccessibilityResults],
+    ) -> AccessibilityResults:
+        """
+        Compute and store a project set's results after a miss, under the set's flight,
+        so that if another caller was computing them already they're used instead
+
+            Args
+                project_ids (`Iterable[int]`): the projects, in any order
+                version (`int`): the data version the results are computed from
+                compute (`Callable[[List[int]], AccessibilityResults]`): computes the results of the sorted project ids
+
+            Returns
+                `AccessibilityResults`
+        """
+        key = self.key(canonical_project_ids(project_ids), version)
+
+        with self.flight(key):
+            # whoever held the flight before us may have computed the results
+            results = self._find(key, version, canonical_project_ids(project_ids))
+            if results is not None:
+                self.count("coalesced")
+                return results
+
+            results = compute(list(canonical_project_ids(project_ids)))
+            self.put(project_ids, version, results)
+
+        return results
+
+    @contextmanager
+    def flight(self, key: str):
+        """
+        Hold the key against every other caller in this process and, with a `lock_dir`,
+        in the other processes, blocking until those ahead are done
+        """
+        with self._lock:
+            lock, holders = self._flights.get(key, (Lock(), 0))
+            self._flights[key] = (lock, holders + 1)
+
+        try:
+            with lock, self._file_lock(key):
+                yield
+        finally:
+            with self._lock:
+                lock, holders = self._flights[key]
+                if holders == 1:
+                    del self._flights[key]
+                else:
+                    self._flights[key] = (lock, holders - 1)
+
+    @contextmanager
+    def _file_lock(self, key: str):
+        if self.lock_dir is None:
+            yield
+            return
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        # the files are left in place, removing one could let a waiter and a newcomer
+        # lock different files of the same name
+        with open(os.path.join(self.lock_dir, f"{key}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _find(
+        self, key: str, version: int, project_ids: Tuple[int, ...]
+    ) -> AccessibilityResults | None:
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+
+        results = self.store.get(key)
+
+        if results is not None:
+            with self._lock:
+                self._remember(key, version, project_ids, results)
+
+        return results
+
+    def peek(
+        self, project_ids: Iterable[int], version: int
+    ) -> AccessibilityResults | None:
+        """Look up a project set's results without computing them, `None` if there are none"""
+        project_ids = canonical_project_ids(project_ids)
+        key = self.key(project_ids, version)
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key]
+
+        results = self.store.get(key)
+
+        with self._lock:
+            if results is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["disk_hits"] += 1
+                self._remember(key, version, project_ids, results)
+
+        return results
+
+    def lookup(
+        self, project_ids: Iterable[int], version: int
+    ) -> AccessibilityResults | None:
+        """
+        Look up a project set's results like `peek`, but without counting it in the stats,
+        which are of the requests for a set's results, not of checks on them, e.g. a job's
+        """
+        project_ids = canonical_project_ids(project_ids)
+        return self._find(self.key(project_ids, version), version, project_ids)
+
+    def nearby(
+        self,
+        project_ids: Iterable[int],
+        version: int,
+        base_ids: Iterable[int] | None = None,
+    ) -> Tuple[Tuple[int, ...], AccessibilityResults] | None:
+        """
+        Find cached results of a set one project away from `project_ids`, to derive
+        theirs from. `base_ids`, e.g. the set the client asked for last, is looked up
+        first, then the sets in memory, the most recently used first.
+
+            Args
+                project_ids (`Iterable[int]`): the projects, in any order
+                version (`int`): the data version the results are computed from
+                base_ids (`Iterable[int] | None`): a set to try first, in any order
+
+            Returns
+                `Tuple[Tuple[int, ...], AccessibilityResults] | None`, the nearby set and its results
+        """
+        project_ids = canonical_project_ids(project_ids)
+
+        if base_ids is not None:
+            base_ids = canonical_project_ids(base_ids)
+            if toggled_project(base_ids, project_ids) is not None:
+                results = self._find(self.key(base_ids, version), version, base_ids)
+                if results is not None:
+                    return base_ids, results
+
+        with self._lock:
+            for key in reversed(self._memory):
+                entry_version, entry_ids = self._sets[key]
+                if (
+                    entry_version == version
+                    and toggled_project(entry_ids, project_ids) is not None
+                ):
+                    return entry_ids, self._memory[key]
+
+        return None
+
+    def put(
+        self, project_ids: Iterable[int], version: int, results: AccessibilityResults
+    ):
+        project_ids = canonical_project_ids(project_ids)
+        key = self.key(project_ids, version)
+        # the version is part of the key, so the entry never goes stale
+        self.store.set(key, results, timeout=0)
+        with self._lock:
+            self._remember(key, version, project_ids, results)
+
+    def _remember(
+        self,
+        key: str,
+        version: int,
+        project_ids: Tuple[int, ...],
+        results: AccessibilityResults,
+    ):
+        self._memory[key] = results
+        self._sets[key] = (version, project_ids)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            del self._sets[evicted]
+
+    def count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Lookup counts of this process since it started. `coalesced` counts the misses
+        that were answered by a computation already under way, so the number of
+        computations run is `misses - coalesced`.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self._stats["memory_hits"],
+                "disk_hits": self._stats["disk_hits"],
+                "misses": self._stats["misses"],
+                "coalesced": self._stats["coalesced"],
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,34 @@
+"""add geometry indexes
+
+Revision ID: 0c021dcff9f2
+Revises: 6c8afbf21a46
+Create Date: 2026-10-18 09:14:52.418306
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0c021dcff9f2"
+down_revision: Union[str, None] = "6c8afbf21a46"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# geoalchemy2 names its spatial indexes idx_<table>_<column> and usually creates them
+# along with the table, so this only fills in whichever are missing
+TABLES = ["arterials", "existing_lanes", "dissemination_areas", "intersections"]
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_geometry ON {table} USING gist (geometry)"
+        )
+
+
+def downgrade() -> None:
+    # the indexes may predate this revision and the models expect them, so leave them be
+    pass
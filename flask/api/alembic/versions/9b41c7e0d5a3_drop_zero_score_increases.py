@@ -0,0 +1,28 @@
+"""drop zero score increases
+
+Revision ID: 9b41c7e0d5a3
+Revises: 3d9a4f6b2c17
+Create Date: 2026-10-18 16:40:52.104716
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9b41c7e0d5a3"
+down_revision: Union[str, None] = "3d9a4f6b2c17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # a missing budget score now means no increase, so the zeros are redundant
+    op.execute("DELETE FROM budget_scores WHERE budget_id IS NOT NULL AND score = 0")
+
+
+def downgrade() -> None:
+    # the deleted rows are equivalent to missing ones, there's nothing to restore
+    pass
@@ -0,0 +1,57 @@
+"""add materialized views
+
+Revision ID: e7a3b90c4d18
+Revises: c5e82d1f7a94
+Create Date: 2026-10-18 19:15:48.203611
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a3b90c4d18"
+down_revision: Union[str, None] = "c5e82d1f7a94"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# see `api.views`, the unique indexes let the views be refreshed concurrently
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW baseline_score_pivot AS
+        SELECT budget_scores.dissemination_area_id,
+            jsonb_object_agg(metrics.name, budget_scores.score) AS scores
+        FROM budget_scores JOIN metrics ON metrics.id = budget_scores.metric_id
+        WHERE budget_scores.budget_id IS NULL
+        GROUP BY budget_scores.dissemination_area_id
+        """
+    )
+    op.execute(
+        "CREATE UNIQUE INDEX ix_baseline_score_pivot_dissemination_area_id "
+        "ON baseline_score_pivot (dissemination_area_id)"
+    )
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW arterial_project_ids AS
+        SELECT budget_project_members.arterial_id,
+            array_agg(
+                budget_project_members.project_id
+                ORDER BY budget_project_members.project_id
+            ) AS project_ids
+        FROM budget_project_members
+        GROUP BY budget_project_members.arterial_id
+        """
+    )
+    op.execute(
+        "CREATE UNIQUE INDEX ix_arterial_project_ids_arterial_id "
+        "ON arterial_project_ids (arterial_id)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW arterial_project_ids")
+    op.execute("DROP MATERIALIZED VIEW baseline_score_pivot")
@@ -1,33 +1,89 @@
-from collections import defaultdict
-import json
+from datetime import datetime
+from functools import wraps
 import logging
 import traceback
-
-from cycle_calc.calculate_accessibility import main as calculate_accessibility
-import geojson
-from flask import Blueprint, Flask, Response, jsonify, request
+from typing import List, Tuple
+
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
 from flask_caching import Cache
 from flask_compress import Compress
 from flask_cors import CORS
 import logging
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload, selectinload
-from werkzeug.exceptions import HTTPException, NotFound, UnprocessableEntity
+import numpy as np
+from shapely import wkt
+from werkzeug.exceptions import (
+    HTTPException,
+    InternalServerError,
+    NotFound,
+    UnprocessableEntity,
+)
 from werkzeug.wrappers.response import Response
 
-from api.models import (
-    db,
-    Arterial,
-    Budget,
-    BudgetProjectMember,
-    BudgetScore,
-    DisseminationArea,
-    ExistingLane,
-    Intersection,
-    Metric,
+from api.accessibility import (
+    ACCESSIBILITY_METRICS,
+    AccessibilityCache,
+    AccessibilityResults,
+    merge_recomputed,
+    takes_origin_ids,
+    toggled_project,
+)
+from api.artifacts import (
+    BUDGET_ARTERIALS_ARTIFACT,
+    BUDGET_SCORES_ARTIFACT,
+    artifact_response,
+    topology_artifact_name,
+)
+from api.compute_context import ComputeContext, load_compute_context
+from api.engine import calculate_accessibility, load_engine
+from api.jobs import FAILED, PENDING, AccessibilityJobs
+from api.json_provider import OrjsonProvider
+from api.layers import (
+    LAYERS,
+    MAX_TILE_ZOOM,
+    Layer,
+    feature_collection_query,
+    simplification_tier,
+    spatial_filters,
+    stream_feature_collection,
+    tile_query,
+    tolerance_for_zoom,
+)
+from api.models import db
+from api.queries import (
+    budget_exists,
+    fetch_budget_ids,
+    fetch_budget_members,
+    fetch_budgets_members,
+    fetch_budgets,
+    fetch_affected_origins,
+    fetch_data_version,
+    fetch_metrics,
+    group_members_by_budget,
+)
+from api.scores import (
+    BINARY_SCORES_MIMETYPE,
+    SCORE_FORMATS,
+    ScoreColumns,
+    ScoreCube,
+    budget_scores_query,
+    budgets_scores_query,
+    changed_das,
+    fetch_baseline_scores,
+    load_score_cube,
+    summarize,
 )
 from api.settings import app_settings
-from api.utils import properties_to_geojson_features, model_to_dict, DaScoreResult
+from api.summaries import fetch_budget_summaries, summarize_increases
+from api.topojson import render_topology
+from api.utils import DaScoreResult
 
 logger = logging.getLogger(__name__)
 
@@ -36,27 +92,65 @@ cycling_api = Blueprint(
     __name__,
 )
 
+CACHE_TIMEOUT = 60 * 60  # 1 hour cache timeout
+
+# shared by the gunicorn workers (and kept across their restarts), see `api.warmup`
 default_cache = Cache(
     config={
-        "CACHE_TYPE": "simple",
-        "CACHE_DEFAULT_TIMEOUT": 60 * 60,  # 1 hour cache timeout
+        "CACHE_TYPE": app_settings.CACHE_TYPE,
+        "CACHE_DIR": app_settings.CACHE_DIR,
+        "CACHE_THRESHOLD": app_settings.CACHE_THRESHOLD,
+        "CACHE_DEFAULT_TIMEOUT": CACHE_TIMEOUT,
     },
 )
 
 compress = Compress()
 
+# the shared tier is the response cache, so results are dropped along with it on import
+accessibility_cache = AccessibilityCache(
+    default_cache, app_settings.ACCESSIBILITY_MEMORY_ENTRIES, app_settings.LOCK_DIR
+)
+
+# started lazily, so each gunicorn worker gets its own pool, whose processes each load
+# the engine as they start
+accessibility_jobs = AccessibilityJobs(
+    accessibility_cache, app_settings.ACCESSIBILITY_POOL_SIZE, initializer=load_engine
+)
+
+# how long a worker trusts its copy of the data version before checking the database,
+# so an import is picked up within this many seconds
+DATA_VERSION_TTL = 30
+
 
 def create_app(
     testing=False,
     cache: None | Cache = default_cache,
     compress: None | Compress = compress,
 ):
+    if app_settings.ACCESSIBILITY_REACH_METERS is not None and not takes_origin_ids(
+        calculate_accessibility
+    ):
+        raise RuntimeError(
+            "ACCESSIBILITY_REACH_METERS is set, but the accessibility engine can't "
+            "compute a subset of origins (it takes no `origin_ids`), unset it"
+        )
+
     app = Flask(__name__)
+    # every dict a view returns, jsonify and the error handlers encode through this
+    app.json = OrjsonProvider(app)
+    app.json.float_precision = app_settings.JSON_FLOAT_PRECISION
     app.config["SQLALCHEMY_DATABASE_URI"] = (
         app_settings.POSTGRES_CONNECTION_STRING
         if not testing
         else app_settings.TEST_DB_CONNECTION_STRING
     )
+    # don't let tests pick up artifacts built from real data
+    app.config["ARTIFACT_DIR"] = app_settings.ARTIFACT_DIR if not testing else None
+    app.config["STREAM_LAYERS"] = app_settings.STREAM_LAYERS
+    app.config["ACCESSIBILITY_REACH_METERS"] = app_settings.ACCESSIBILITY_REACH_METERS
+    # flask-compress reads a streamed body in full before compressing it, which would
+    # undo streaming the layers, so those go out as they are
+    app.config["COMPRESS_STREAMS"] = False
     db.init_app(app)
     app.register_blueprint(cycling_api)
     CORS(app)
@@ -65,7 +159,11 @@ def create_app(
         compress.init_app(app)
 
     if cache:
-        cache.init_app(app)
+        # a shared cache would carry responses over from one test to the next
+        cache.init_app(
+            app,
+            config={**cache.config, "CACHE_TYPE": "SimpleCache"} if testing else None,
+        )
 
     return app
 
@@ -73,245 +171,578 @@ def create_app(
 logger = logging.getLogger(__name__)
 
 
+def _data_version() -> Tuple[int, datetime | None]:
+    """
+    The current data version and when it was set, read from the cache so that most
+    requests don't touch the database. A changed version clears the response cache.
+    """
+    stamp = default_cache.get("data-version")
+
+    if stamp is None:
+        row = fetch_data_version(db.session)
+        stamp = (row.version, row.updated_at) if row else (0, None)
+        seen = default_cache.get("data-version-seen")
+        if seen is not None and seen != stamp[0]:
+            default_cache.clear()
+        default_cache.set("data-version-seen", stamp[0], timeout=0)
+        default_cache.set("data-version", stamp, timeout=DATA_VERSION_TTL)
+
+    return stamp
+
+
+def _not_modified(etag: str, last_modified: datetime | None):
+    if request.if_none_match:
+        # flask-compress suffixes the tags of compressed bodies with the encoding
+        return request.if_none_match.star_tag or any(
+            tag.split(":")[0] == etag
+            for tag in request.if_none_match.as_set(include_weak=True)
+        )
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def _score_cube() -> ScoreCube:
+    """The app's score cube, reloaded when the data version changes"""
+    version, _ = _data_version()
+    loaded = current_app.extensions.get("score_cube")
+
+    if loaded is None or loaded[0] != version:
+        loaded = (version, load_score_cube(db.session))
+        current_app.extensions["score_cube"] = loaded
+
+    return loaded[1]
+
+
+def _compute_context() -> ComputeContext:
+    """The app's accessibility context, reloaded when the data version changes"""
+    version, _ = _data_version()
+    context = current_app.extensions.get("compute_context")
+
+    if context is None or context.version != version:
+        context = load_compute_context(db.session, version, _score_cube())
+        current_app.extensions["compute_context"] = context
+
+    return context
+
+
+def preload(app: Flask):
+    """
+    Load what an accessibility request reads ahead of the first one: the engine's
+    network, the score cube and the origin index. Run in the gunicorn master, the workers
+    it forks afterwards share them.
+    """
+    load_engine()
+
+    with app.app_context():
+        try:
+            _compute_context()
+        finally:
+            # the workers open their own connections
+            db.engine.dispose()
+
+
+def versioned(view):
+    """
+    Validate a route's responses with the data version: answer a matching
+    conditional request with a 304 before the view runs, otherwise tag the response
+    with an `ETag` and `Last-Modified` derived from the version. Responses that
+    carry their own `ETag` (pre-rendered artifacts) keep it.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version, updated_at = _data_version()
+        etag = f"v{version}"
+
+        if _not_modified(etag, updated_at):
+            res = Response(status=304)
+            res.set_etag(etag)
+            res.last_modified = updated_at
+            return res
+
+        res = current_app.make_response(view(*args, **kwargs))
+
+        if res.status_code == 200 and "ETag" not in res.headers:
+            res.set_etag(etag)
+            if updated_at is not None:
+                res.last_modified = updated_at
+            # have clients revalidate rather than guess at freshness
+            if "Cache-Control" not in res.headers:
+                res.cache_control.no_cache = True
+
+        return res
+
+    return wrapper
+
+
 @cycling_api.route("/budgets", methods=["GET"])
+@versioned
 def get_budgets():
-    results = db.session.execute(select(Budget)).scalars().all()
-    return [model_to_dict(result) for result in results]
+    return [row._asdict() for row in fetch_budgets(db.session)]
 
 
 @cycling_api.route("/arterials", methods=["GET"])
-@default_cache.cached()
+@versioned
 def get_arterials():
-    arterials = [
-        {
-            "default_project_id": a.default_project_id,
-            "total_length": a.total_length,
-            "id": a.id,
-            "budget_project_ids": [p.project_id for p in a.improvement_relationships],
-            "feature_type": "arterial",
-            "geometry": a.geometry,
-            "GEO_ID": a.GEO_ID,
-        }
-        for a in db.session.execute(
-            select(Arterial).options(selectinload(Arterial.improvement_relationships))
-        )
-        .scalars()
-        .all()
-    ]
+    return _layer_response("arterials")
 
-    data = properties_to_geojson_features(arterials)
 
-    return Response(geojson.dumps(data), content_type="application/json")
+@cycling_api.route("/budgets/arterials")
+@versioned
+def get_budgets_arterials():
+    budget_ids = _parse_budget_ids()
 
+    # artifacts are files served in the client's encoding, so they bypass the cache
+    if budget_ids is None:
+        artifact = artifact_response(BUDGET_ARTERIALS_ARTIFACT)
+        if artifact is not None:
+            return artifact
+
+    return _budgets_arterials(budget_ids)
 
-@cycling_api.route("/budgets/<int:id>/arterials")
-@default_cache.cached()
-def get_budget_arterials(id):
 
-    budget = db.session.execute(select(Budget).filter(Budget.id == id)).scalar()
+@default_cache.memoize()
+def _budgets_arterials(budget_ids: List[int] | None):
+    found = _existing_budget_ids(budget_ids)
 
-    if budget is None:
+    return group_members_by_budget(fetch_budgets_members(db.session, found), found)
+
+
+@cycling_api.route("/budgets/scores")
+@versioned
+def get_budgets_scores():
+    budget_ids = _parse_budget_ids()
+
+    if budget_ids is None:
+        artifact = artifact_response(BUDGET_SCORES_ARTIFACT)
+        if artifact is not None:
+            return artifact
+
+    return Response(_budgets_scores(budget_ids), content_type="application/json")
+
+
+@default_cache.memoize()
+def _budgets_scores(budget_ids: List[int] | None):
+    """The scores are rendered by postgres, so the text is sent as-is"""
+    scores, found = db.session.execute(budgets_scores_query(budget_ids)).first()
+
+    if budget_ids is not None and len(found or []) != len(set(budget_ids)):
         raise NotFound("Budget not found!")
 
-    results = (
-        db.session.execute(
-            select(BudgetProjectMember).filter(BudgetProjectMember.budget_id == id)
+    return scores
+
+
+def _parse_budget_ids():
+    """Parse the `ids` param of the batch budget routes, `None` means all budgets"""
+    ids = request.args.get("ids")
+    if ids is None:
+        raise UnprocessableEntity("ids are required!")
+    if ids == "all":
+        return None
+    try:
+        return [int(id) for id in ids.split(",")]
+    except ValueError:
+        raise UnprocessableEntity(
+            "ids should be all or a comma-separated list of integers!"
         )
-        .scalars()
-        .all()
-    )
 
-    return [model_to_dict(result) for result in results]
 
+def _existing_budget_ids(budget_ids: List[int] | None):
+    found = fetch_budget_ids(db.session, budget_ids)
+    if budget_ids is not None and len(found) != len(set(budget_ids)):
+        raise NotFound("Budget not found!")
+    return found
 
-@cycling_api.route("/default-scores")
+
+@cycling_api.route("/budgets/summary")
+@versioned
 @default_cache.cached()
-def get_default_scores():
+def get_budgets_summary():
+    # precomputed at import, see `api.summaries`
+    return fetch_budget_summaries(db.session)
 
-    defaults: list[BudgetScore] = (
-        db.session.execute(
-            select(BudgetScore)
-            .options(joinedload(BudgetScore.dissemination_area))
-            .options(joinedload(BudgetScore.metric))
-            .filter(BudgetScore.budget == None)
-        )
-        .scalars()
-        .all()
-    )
 
-    default_dict = defaultdict(dict)
+@cycling_api.route("/budgets/<int:id>/arterials")
+@versioned
+@default_cache.cached()
+def get_budget_arterials(id):
+
+    if not budget_exists(db.session, id):
+        raise NotFound("Budget not found!")
 
-    for d in defaults:
-        default_dict[d.dissemination_area_id][d.metric.name] = d.score
-        default_dict[d.dissemination_area_id]["da"] = d.dissemination_area_id
+    return [row._asdict() for row in fetch_budget_members(db.session, id)]
 
-    return default_dict
+
+@cycling_api.route("/default-scores")
+@versioned
+@default_cache.cached(query_string=True)
+def get_default_scores():
+    output_format = _score_format()
+
+    if output_format == "json":
+        return fetch_baseline_scores(db.session)
+
+    return _score_response(_score_cube().baseline_columns(), output_format)
 
 
 @cycling_api.route("/budgets/<int:budget_id>/scores")
-@default_cache.cached()
+@versioned
+@default_cache.cached(query_string=True)
 def get_project_scores(budget_id):
-    budget: Budget = db.session.execute(
-        select(Budget)
-        .options(joinedload(Budget.scores).subqueryload(BudgetScore.dissemination_area))
-        .filter(Budget.id == budget_id)
-    ).scalar()
+    output_format = _score_format()
+    sparse = _sparse()
 
-    defaults: list[BudgetScore] = (
-        db.session.execute(
-            select(BudgetScore)
-            .options(joinedload(BudgetScore.dissemination_area))
-            .options(joinedload(BudgetScore.metric))
-            .filter(BudgetScore.budget == None)
-            .filter(
-                BudgetScore.dissemination_area_id.in_(
-                    [s.dissemination_area_id for s in budget.scores]
-                )
-            )
-        )
-        .scalars()
-        .all()
-    )
+    if output_format == "json" and not sparse:
+        # the payload is joined, derived and aggregated by postgres in one statement
+        scores = db.session.execute(budget_scores_query(budget_id)).scalar()
+
+        if scores is None:
+            raise NotFound("Budget not found!")
+
+        return Response(scores, content_type="application/json")
 
-    default_dict = defaultdict(dict)
+    cube = _score_cube()
 
-    for d in defaults:
-        default_dict[d.dissemination_area_id][d.metric.name] = d.score
+    if not cube.has_budget(budget_id):
+        raise NotFound("Budget not found!")
 
-    scores = DaScoreResult()
+    return _score_response(cube.budget_columns(budget_id), output_format, sparse)
 
-    for score in budget.scores:
-        baseline_score = default_dict[score.dissemination_area_id][score.metric.name]
 
-        scores.add_da_metric(
-            da_id=score.dissemination_area_id,
-            metric=score.metric.name,
-            base_score=baseline_score,
-            score=score.score,
+def _score_format():
+    output_format = request.args.get("format", "json")
+    if output_format not in SCORE_FORMATS:
+        raise UnprocessableEntity(
+            f"format should be one of {', '.join(SCORE_FORMATS)}!"
         )
+    return output_format
+
+
+def _sparse():
+    return request.args.get("sparse") == "true"
+
 
-    return jsonify(scores.to_dict())
+def _score_response(columns: ScoreColumns, output_format: str, sparse: bool = False):
+    """
+    Serve scores in the requested format, see `ScoreColumns`. Sparse responses only
+    hold the DAs that changed, under `scores`, with the stats of all of them under `summary`.
+    """
+    summary = None
+    if sparse:
+        summary = summarize(columns)
+        columns = changed_das(columns)
+
+    if output_format == "binary":
+        return Response(columns.to_binary(summary), content_type=BINARY_SCORES_MIMETYPE)
+
+    scores = columns.to_dict() if output_format == "json" else columns.to_columnar()
+
+    return jsonify({"scores": scores, "summary": summary} if sparse else scores)
 
 
 @cycling_api.route("/metrics")
+@versioned
 def get_metrics():
-    metrics = db.session.execute(select(Metric)).scalars().all()
-    return [model_to_dict(metric) for metric in metrics]
+    return [row._asdict() for row in fetch_metrics(db.session)]
 
 
 @cycling_api.route("/existing-lanes")
-@default_cache.cached(key_prefix="/existing-lanes")
+@versioned
 def get_existing_lanes():
-    lanes = [
-        {
-            "id": e.id,
-            "total_length": e.total_length,
-            "geometry": e.geometry,
-            "feature_type": "existing_lane",
-            "INFRA_HIGHORDER": e.INFRA_HIGHORDER,
-        }
-        for e in db.session.execute(select(ExistingLane)).scalars().all()
-    ]
-    data = properties_to_geojson_features(lanes)
-    # dumping is much faster than jsonify
-    res = Response(geojson.dumps(data), content_type="application/json")
-    return res
+    return _layer_response("existing-lanes")
 
 
 @cycling_api.route("/das")
-@default_cache.cached(key_prefix="/das")
+@versioned
 def get_das():
-    das = [
-        {"id": d.id, "DAUID": d.DAUID, "geometry": d.geometry}
-        for d in db.session.execute(select(DisseminationArea)).scalars().all()
-    ]
-    data = properties_to_geojson_features(das)
-    res = Response(geojson.dumps(data), content_type="application/json")
-    return res
+    output_format = request.args.get("format", "geojson")
+    if output_format == "topojson":
+        return _topology_response("das")
+    if output_format != "geojson":
+        raise UnprocessableEntity("format should be geojson or topojson!")
+    return _layer_response("das")
 
 
 @cycling_api.route("/intersections")
-@default_cache.cached(key_prefix="/intersections")
+@versioned
 def get_intersections():
-    intersections = [
-        {"id": i.id, "INTERSECTION_ID": i.INTERSECTION_ID, "geometry": i.geometry}
-        for i in db.session.execute(select(Intersection)).scalars().all()
-    ]
-    data = properties_to_geojson_features(intersections)
-    res = Response(geojson.dumps(data), content_type="application/json")
+    return _layer_response("intersections")
+
+
+@cycling_api.route("/tiles/<layer>/<int:z>/<int:x>/<int:y>.pbf")
+@versioned
+@default_cache.cached()
+def get_tile(layer, z, x, y):
+    if layer not in LAYERS:
+        raise NotFound("Layer not found!")
+
+    if z > MAX_TILE_ZOOM or x >= 2**z or y >= 2**z:
+        raise NotFound("Tile not found!")
+
+    tile = db.session.execute(tile_query(LAYERS[layer], z, x, y)).scalar()
+
+    res = Response(
+        bytes(tile or b""), content_type="application/vnd.mapbox-vector-tile"
+    )
+    res.cache_control.public = True
+    res.cache_control.max_age = CACHE_TIMEOUT
     return res
 
 
+def _parse_bbox(bbox: str | None):
+    if bbox is None:
+        return None
+    try:
+        # rounding normalizes the cache key, ~10cm is more than enough for a viewport
+        values = tuple(round(float(v), 6) for v in bbox.split(","))
+    except ValueError:
+        raise UnprocessableEntity("bbox should be a comma-separated list of numbers!")
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise UnprocessableEntity(
+            "bbox should be min longitude, min latitude, max longitude, max latitude!"
+        )
+    return values
+
+
+def _parse_intersects(intersects: str | None):
+    if intersects is None:
+        return None
+    try:
+        return wkt.dumps(wkt.loads(intersects), rounding_precision=6)
+    except Exception as e:
+        logger.error(e)
+        raise UnprocessableEntity("intersects should be a WKT geometry!")
+
+
+def _parse_tier(layer: Layer):
+    """Resolve the `zoom` or `tolerance` param to one of the layer's simplification tiers"""
+    zoom = request.args.get("zoom", type=int)
+    tolerance = request.args.get("tolerance", type=float)
+    if tolerance is None and zoom is not None:
+        tolerance = tolerance_for_zoom(zoom)
+    return simplification_tier(layer, tolerance)
+
+
+def _layer_response(name: str):
+    """Serve the pre-rendered artifact if one was built at import time, else render the layer"""
+    bbox = _parse_bbox(request.args.get("bbox"))
+    intersects = _parse_intersects(request.args.get("intersects"))
+    tier = _parse_tier(LAYERS[name])
+
+    # artifacts hold the whole city at full detail
+    if bbox is None and intersects is None and tier is None:
+        artifact = artifact_response(name)
+        if artifact is not None:
+            return artifact
+
+    if current_app.config["STREAM_LAYERS"]:
+        filters = spatial_filters(LAYERS[name], bbox, intersects)
+        return Response(
+            stream_with_context(
+                stream_feature_collection(db.session, LAYERS[name], filters, tier)
+            ),
+            content_type="application/json",
+        )
+
+    return Response(
+        _render_layer(name, bbox, intersects, tier), content_type="application/json"
+    )
+
+
+def _topology_response(name: str):
+    artifact = artifact_response(topology_artifact_name(name))
+    if artifact is not None:
+        return artifact
+    return Response(_render_topology(name), content_type="application/json")
+
+
+@default_cache.memoize()
+def _render_topology(name: str):
+    return render_topology(db.session, LAYERS[name])
+
+
+@default_cache.memoize()
+def _render_layer(
+    name: str,
+    bbox: Tuple[float, float, float, float] | None = None,
+    intersects: str | None = None,
+    tier: float | None = None,
+):
+    """The FeatureCollection is rendered by PostGIS, so the text is sent as-is"""
+    layer = LAYERS[name]
+    return db.session.execute(
+        feature_collection_query(layer, spatial_filters(layer, bbox, intersects), tier)
+    ).scalar()
+
+
 @cycling_api.route("/accessibility")
 def get_accessibility():
-    project_ids = request.args.get("project_ids")
+    """
+    The scores of a project set. A client toggling projects one at a time can pass the
+    set it asked for last as `base_project_ids`, to have the new set derived from it.
+    That is only done with `ACCESSIBILITY_REACH_METERS` set; otherwise, and when the sets
+    differ by more than one project, it's ignored and the set is computed in full.
+    """
+    project_ids = _parse_project_ids()
+    base_ids = (
+        _parse_project_ids("base_project_ids")
+        if "base_project_ids" in request.args
+        else None
+    )
+    # validate before the computation rather than after
+    _score_format()
+
+    version, _ = _data_version()
+    results = accessibility_cache.get(
+        project_ids,
+        version,
+        lambda project_ids: _calculate_accessibility(project_ids, version, base_ids),
+    )
+
+    return _accessibility_response(results)
+
+
+def _calculate_accessibility(
+    project_ids: List[int], version: int, base_ids: List[int] | None
+) -> AccessibilityResults:
+    """
+    Derive a set's results from those of a cached set one project away when possible,
+    recomputing only the origins within reach of that project, else compute them all
+    """
+    reach = current_app.config["ACCESSIBILITY_REACH_METERS"]
+    nearby = (
+        accessibility_cache.nearby(project_ids, version, base_ids)
+        if reach is not None
+        else None
+    )
+
+    if nearby is None:
+        return calculate_accessibility(project_ids, ACCESSIBILITY_METRICS)
+
+    nearby_ids, base = nearby
+    # only origins with a DA are served, so the others' scores can stay as they were
+    origin_ids = fetch_affected_origins(
+        db.session, toggled_project(nearby_ids, project_ids), reach
+    )
+    recomputed = calculate_accessibility(
+        project_ids, ACCESSIBILITY_METRICS, origin_ids=origin_ids
+    )
+    return merge_recomputed(base, origin_ids, recomputed)
+
+
+@cycling_api.route("/accessibility/jobs", methods=["POST"])
+def create_accessibility_job():
+    project_ids = _parse_project_ids()
+    version, _ = _data_version()
+
+    job = accessibility_jobs.submit(
+        project_ids,
+        version,
+        calculate_accessibility,
+        ACCESSIBILITY_METRICS,
+        context=current_app._get_current_object().app_context,
+    )
+
+    res = jsonify({"id": job["id"], "status": job["status"]})
+    res.status_code = 202
+    res.headers["Location"] = f"/accessibility/jobs/{job['id']}"
+    return res
+
+
+@cycling_api.route("/accessibility/jobs/<job_id>")
+def get_accessibility_job(job_id: str):
+    """
+    The status of a pending job, or the results of a finished one in the same formats
+    as `/accessibility`
+    """
+    job = accessibility_jobs.get(job_id)
+
+    if job is None:
+        raise NotFound("Job not found!")
+
+    if job["status"] == FAILED:
+        raise InternalServerError("The accessibility computation failed!")
+
+    if job["status"] == PENDING:
+        return {"id": job["id"], "status": job["status"]}, 202
+
+    results = accessibility_cache.lookup(job["project_ids"], job["version"])
+
+    if results is None:
+        raise NotFound("The job's results have expired!")
+
+    return _accessibility_response(results)
+
+
+def _parse_project_ids(param: str = "project_ids"):
+    project_ids = request.args.get(param)
     if project_ids is None:
-        raise UnprocessableEntity("project_ids are required!")
+        raise UnprocessableEntity(f"{param} are required!")
     try:
-        project_ids_list = [int(id) for id in project_ids.split(",")]
+        return [int(id) for id in project_ids.split(",")]
     except Exception as e:
         logger.error(e)
         raise UnprocessableEntity(
             "Project ids should be a comma-separate list of integers!"
         )
 
-    da_map = {
-        da.origin_id: da.id
-        for da in db.session.execute(select(DisseminationArea)).scalars().all()
-    }
-
-    defaults = (
-        db.session.execute(
-            select(BudgetScore)
-            .options(joinedload(BudgetScore.metric))
-            .options(joinedload(BudgetScore.dissemination_area))
-            .filter(BudgetScore.budget_id == None)
-        )
-        .scalars()
-        .all()
-    )
-
-    default_map = {}
 
-    for default in defaults:
-        if not default_map.get(default.dissemination_area.id):
-            default_map[default.dissemination_area.id] = {}
-        default_map[default.dissemination_area.id][default.metric.name] = default.score
+def _accessibility_response(results: AccessibilityResults):
+    """Join accessibility results to the baseline and serve them in the requested format"""
+    output_format = _score_format()
+    sparse = _sparse()
 
-    results = calculate_accessibility(project_ids_list, ["job", "populations"])
+    context = _compute_context()
 
-    score_dict = DaScoreResult()
+    score_dict = DaScoreResult(context.da_ids.tolist())
 
     for metric, scores in results.items():
-        for origin_id, score in scores.items():
-            if da_map.get(origin_id):
-                da_id = da_map[origin_id]
-                score_dict.add_da_metric(
-                    da_id=da_id,
-                    metric=metric,
-                    score=float(score),
-                    base_score=default_map[da_id][metric],
-                )
+        positions, found = context.lookup(
+            np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        )
+        positions = positions[found]
+        score_dict.add_metric_vector(
+            metric=metric,
+            da_ids=context.da_ids[positions].tolist(),
+            scores=np.fromiter(scores.values(), dtype=np.float64, count=len(scores))[
+                found
+            ],
+            base_scores=context.baseline_scores(metric, positions),
+        )
+
+    # the same numbers `/budgets/summary` has for each budget, bar the arterials
+    if request.args.get("summary") == "true":
+        return summarize_increases(score_dict.to_columns())
+
+    if output_format == "json" and not sparse:
+        return current_app.json.response(score_dict.to_dict())
+
+    return _score_response(score_dict.to_columns(), output_format, sparse)
+
 
-    return jsonify(score_dict.to_dict())
+@cycling_api.route("/accessibility/cache")
+def get_accessibility_cache_stats():
+    """
+    How often this worker's accessibility lookups were served from each cache tier,
+    or by waiting for an identical computation, and how many of its job submits were
+    given a job already under way
+    """
+    return {**accessibility_cache.stats(), "jobs": accessibility_jobs.stats()}
 
 
 # https://flask.palletsprojects.com/en/2.2.x/errorhandling/#generic-exception-handlers
 @cycling_api.errorhandler(HTTPException)
 def handle_http_exception(e: HTTPException):
     """Return JSON instead of HTML for HTTP errors."""
-    # create a werkzeug response
-    response = Response()
     logger.error(traceback.print_exception(e))
-    response.data = json.dumps(
+    return current_app.json.response(
         {
             "code": e.code,
             "name": e.name,
             "description": e.description,
         }
     )
-    response.content_type = "application/json"
-    return response
 
 
 @cycling_api.errorhandler(Exception)
@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List
+
+import brotli
+from flask import Response, current_app, request, send_file
+from sqlalchemy.orm import Session
+
+from api.json_provider import dumps_bytes
+from api.layers import LAYERS, feature_collection_query
+from api.queries import fetch_budget_ids, fetch_budgets_members, group_members_by_budget
+from api.scores import render_budgets_scores
+from api.topojson import render_topology
+
+MANIFEST_NAME = "manifest.json"
+
+# content-encoding => file suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz", "identity": ""}
+
+# polygon layers that are also served as TopoJSON
+TOPOLOGY_LAYERS = ["das"]
+
+# the batch budget routes' payloads for every budget, served for `ids=all`
+BUDGET_SCORES_ARTIFACT = "budget-scores"
+BUDGET_ARTERIALS_ARTIFACT = "budget-arterials"
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write to a temp file and move it into place so a worker never reads a partial file"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def artifact_path(directory: str | Path, name: str, encoding: str):
+    return Path(directory) / f"{name}.json{ENCODINGS[encoding]}"
+
+
+def topology_artifact_name(name: str):
+    return f"{name}-topology"
+
+
+def _write_artifact(directory: Path, name: str, body: str):
+    data = body.encode()
+
+    encoded = {
+        "identity": data,
+        "gzip": gzip.compress(data, compresslevel=9),
+        "br": brotli.compress(data, quality=11),
+    }
+
+    for encoding, content in encoded.items():
+        _write_atomic(artifact_path(directory, name, encoding), content)
+
+    return {
+        "etag": hashlib.sha256(data).hexdigest(),
+        "sizes": {encoding: len(content) for encoding, content in encoded.items()},
+    }
+
+
+def build_artifacts(
+    session: Session, directory: str | Path, layers: List[str] | None = None
+):
+    """
+    Render each layer once (and the topology of those in `TOPOLOGY_LAYERS`), as well as
+    the scores and arterials of every budget, and write the identity, gzip and brotli
+    encoded bodies along with a manifest holding each body's content hash
+
+        Args
+            session (`Session`): the database session
+            directory (`str | Path`): where to write the artifacts
+            layers (`List[str]`): the layers to render, defaults to all of them
+
+        Returns
+            `Dict[str, Dict[str, Any]]`, the manifest
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest(directory) or {}
+
+    for name in layers or LAYERS.keys():
+        body = session.execute(feature_collection_query(LAYERS[name])).scalar()
+        manifest[name] = _write_artifact(directory, name, body)
+
+        if name in TOPOLOGY_LAYERS:
+            manifest[topology_artifact_name(name)] = _write_artifact(
+                directory,
+                topology_artifact_name(name),
+                render_topology(session, LAYERS[name]),
+            )
+
+    manifest[BUDGET_SCORES_ARTIFACT] = _write_artifact(
+        directory, BUDGET_SCORES_ARTIFACT, render_budgets_scores(session)
+    )
+
+    members = group_members_by_budget(
+        fetch_budgets_members(session), fetch_budget_ids(session)
+    )
+    manifest[BUDGET_ARTERIALS_ARTIFACT] = _write_artifact(
+        directory, BUDGET_ARTERIALS_ARTIFACT, dumps_bytes(members).decode()
+    )
+
+    # the manifest goes last so it never points at bodies that aren't written yet
+    _write_atomic(directory / MANIFEST_NAME, json.dumps(manifest).encode())
+
+    return manifest
+
+
+def load_manifest(directory: str | Path) -> Dict[str, Dict[str, Any]] | None:
+    try:
+        with open(Path(directory) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def artifact_response(name: str) -> Response | None:
+    """
+    Serve a pre-rendered body in the best encoding the client accepts,
+    or return `None` if it hasn't been built
+
+        Args
+            name (`str`): the artifact name
+
+        Returns
+            `Response | None`
+    """
+    directory = current_app.config.get("ARTIFACT_DIR")
+
+    if not directory:
+        return None
+
+    manifest = load_manifest(directory)
+
+    if not manifest or name not in manifest:
+        return None
+
+    encoding = request.accept_encodings.best_match(ENCODINGS.keys(), "identity")
+
+    res = send_file(
+        artifact_path(directory, name, encoding),
+        mimetype="application/json",
+        etag=f"{manifest[name]['etag']}.{encoding}",
+        conditional=True,
+    )
+
+    if encoding != "identity":
+        res.headers["Content-Encoding"] = encoding
+    res.vary.add("Accept-Encoding")
+
+    return res
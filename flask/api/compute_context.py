@@ -0,0 +1,89 @@
+# What an `/accessibility` request needs besides the engine's computation, loaded once
+# per data version rather than queried per request: the DA of each of the engine's
+# origins and the baseline scores of those DAs. Under gunicorn it's loaded in the master
+# before the workers fork (see `gunicorn.conf.py`), so the workers share its read-only
+# arrays copy-on-write instead of each building its own on their first request.
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from api.queries import fetch_da_origin_map
+from api.scores import ScoreCube
+
+
+@dataclass(frozen=True)
+class ComputeContext:
+    version: int
+    # sorted, with the DA of each
+    origin_ids: np.ndarray
+    da_ids: np.ndarray
+    metrics: List[str]
+    # [metric, origin], the baseline score of each origin's DA, NaN where there is none
+    baseline: np.ndarray
+
+    def lookup(self, origin_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find origins in the context
+
+            Args
+                origin_ids (`np.ndarray`): the origins, in any order
+
+            Returns
+                `Tuple[np.ndarray, np.ndarray]`, the position of each origin and whether it has a DA at all
+        """
+        origin_ids = np.asarray(origin_ids, dtype=np.int64)
+        if not len(self.origin_ids):
+            return np.zeros(len(origin_ids), dtype=np.intp), np.zeros(
+                len(origin_ids), dtype=bool
+            )
+
+        positions = np.searchsorted(self.origin_ids, origin_ids).clip(
+            max=len(self.origin_ids) - 1
+        )
+        return positions, self.origin_ids[positions] == origin_ids
+
+    def baseline_scores(self, metric: str, positions: np.ndarray) -> np.ndarray:
+        """A metric's baseline score at each of the origin `positions`, NaN where there is none"""
+        if metric not in self.metrics:
+            return np.full(len(positions), np.nan)
+        return self.baseline[self.metrics.index(metric), positions]
+
+
+def _read_only(values: np.ndarray):
+    # a write would copy the page it's on into the worker that made it
+    values.setflags(write=False)
+    return values
+
+
+def load_compute_context(session: Session, version: int, cube: ScoreCube):
+    """
+    Index the engine's origins by id and align the baseline scores to them
+
+        Args
+            session (`Session`): the database session
+            version (`int`): the data version `cube` was loaded at
+            cube (`ScoreCube`): the scores
+
+        Returns
+            `ComputeContext`
+    """
+    da_map = fetch_da_origin_map(session)
+    origin_ids = np.fromiter(da_map.keys(), dtype=np.int64, count=len(da_map))
+    da_ids = np.fromiter(da_map.values(), dtype=np.int64, count=len(da_map))
+    order = np.argsort(origin_ids)
+    origin_ids, da_ids = origin_ids[order], da_ids[order]
+
+    baseline = np.empty((len(cube.metrics), len(da_ids)))
+    for row, metric in enumerate(cube.metrics):
+        baseline[row] = cube.baseline_scores(metric, da_ids)
+
+    return ComputeContext(
+        version=version,
+        origin_ids=_read_only(origin_ids),
+        da_ids=_read_only(da_ids),
+        metrics=list(cube.metrics),
+        baseline=_read_only(baseline),
+    )
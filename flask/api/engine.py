@@ -0,0 +1,23 @@
+# The accessibility engine, `cycle_calc`, whose `main` builds what it needs of the network
+# as it runs. `load_engine` has that done ahead of the first request: called in the
+# gunicorn master (see `api.app.preload`), it leaves whatever the engine keeps at module
+# level loaded before the workers are forked, so they share it copy-on-write.
+
+from cycle_calc.calculate_accessibility import main as calculate_accessibility
+
+from api.accessibility import ACCESSIBILITY_METRICS
+
+_loaded = False
+
+
+def load_engine():
+    """
+    Run the engine once on the existing network, the smallest project set, so what it
+    loads on its first run is in place before the first computation. Only the first
+    call in a process runs it.
+    """
+    global _loaded
+
+    if not _loaded:
+        calculate_accessibility([], ACCESSIBILITY_METRICS)
+        _loaded = True
@@ -0,0 +1,209 @@
+# Accessibility computations as jobs: the network computation runs on a process pool
+# instead of in the web worker that received the request, and each job's state lives
+# in the shared cache so any worker can report on it.
+
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+import logging
+from multiprocessing import get_context
+import os
+from socket import gethostname
+from threading import Lock
+from typing import Any, Callable, ContextManager, Dict, List
+from uuid import uuid4
+
+from api.accessibility import AccessibilityCache, canonical_project_ids
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# how long a job's state is kept, finished results are kept by the `AccessibilityCache`
+JOB_TIMEOUT = 60 * 60
+
+Job = Dict[str, Any]
+
+
+def _orphaned(job: Job) -> bool:
+    """
+    Whether a pending job's worker has exited, so it will never finish. Only workers
+    on this host can be checked, those of others are assumed to be running.
+    """
+    host, pid = job.get("owner", (None, None))
+    if job["status"] != PENDING or host != gethostname():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # it exists, but belongs to someone else
+        return False
+    return False
+
+
+class AccessibilityJobs:
+    """
+    Submit accessibility computations to a pool and track them until they finish
+
+        Args
+            results (`AccessibilityCache`): where finished results go, its store also holds the jobs
+            max_workers (`int | None`): the size of the pool, defaults to the number of cores
+            executor (`Executor | None`): runs the computations, defaults to a process pool
+                that is started on first use, so each web worker starts its own after forking
+            initializer (`Callable[[], Any] | None`): run once in each process of the default
+                pool as it starts, e.g. to load what the computations read ahead of the first
+    """
+
+    def __init__(
+        self,
+        results: AccessibilityCache,
+        max_workers: int | None = None,
+        executor: Executor | None = None,
+        initializer: Callable[[], Any] | None = None,
+    ):
+        self.results = results
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self._executor = executor
+        # waits on the pool under the set's flight, see `_run`
+        self._runner = ThreadPoolExecutor(thread_name_prefix="accessibility-job")
+        self._lock = Lock()
+        self._stats: Counter = Counter()
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                # spawned rather than forked, so the children don't inherit the
+                # worker's database connections and threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            return self._executor
+
+    def start(self):
+        """
+        Start the pool's processes ahead of the first job, rather than have that job
+        wait on them and their initializer
+        """
+        pool = self._pool()
+        workers = self.max_workers or os.cpu_count() or 1
+        # the pool starts a process for each task submitted while none is idle
+        for _ in range(workers):
+            pool.submit(os.getpid)
+
+    @staticmethod
+    def key(job_id: str):
+        return f"accessibility-job-{job_id}"
+
+    def _save(self, job: Job):
+        self.results.store.set(self.key(job["id"]), job, timeout=JOB_TIMEOUT)
+
+    def get(self, job_id: str) -> Job | None:
+        job = self.results.store.get(self.key(job_id))
+        if job is not None and _orphaned(job):
+            return {**job, "status": FAILED, "error": "the worker running it exited"}
+        return job
+
+    def submit(
+        self,
+        project_ids: Any,
+        version: int,
+        compute: Callable[..., Any],
+        *args: Any,
+        context: Callable[[], ContextManager] = nullcontext,
+    ) -> Job:
+        """
+        Start computing a project set's results, unless they're already cached
+
+            Args
+                project_ids (`Iterable[int]`): the projects, in any order
+                version (`int`): the data version the results are computed from
+                compute (`Callable`): called in the pool with the sorted project ids and `args`,
+                    so it has to be picklable
+                context (`Callable[[], ContextManager]`): entered to record the outcome, e.g. an app context
+
+            Returns
+                `Job`, with its `id` and `status`
+        """
+        project_ids = list(canonical_project_ids(project_ids))
+        job = {
+            "id": uuid4().hex,
+            "status": PENDING,
+            "project_ids": project_ids,
+            "version": version,
+            # the worker whose pool runs it, the only one that can record the outcome
+            "owner": [gethostname(), os.getpid()],
+        }
+
+        if self.results.lookup(project_ids, version) is not None:
+            job["status"] = DONE
+            self._save(job)
+            return job
+
+        pending_key = self.pending_key(project_ids, version)
+
+        # a separate flight from the results', which is held for a whole computation
+        with self.results.flight(pending_key):
+            pending = self.results.store.get(pending_key)
+            existing = self.get(pending) if pending is not None else None
+            if existing is not None and existing["status"] == PENDING:
+                # the same set was submitted already, share its job
+                with self._lock:
+                    self._stats["coalesced"] += 1
+                return existing
+
+            self._save(job)
+            self.results.store.set(pending_key, job["id"], timeout=JOB_TIMEOUT)
+
+        self._runner.submit(self._run, job, context, compute, *args)
+        return job
+
+    def pending_key(self, project_ids: List[int], version: int):
+        """Where the id of a project set's running job is kept"""
+        return f"{self.results.key(tuple(project_ids), version)}-job"
+
+    def _run(
+        self,
+        job: Job,
+        context: Callable[[], ContextManager],
+        compute: Callable[..., Any],
+        *args: Any,
+    ):
+        pool = self._pool()
+        with context():
+            try:
+                # through the results' flight, so a job and a synchronous request for
+                # the same set share a single computation, whichever comes first
+                self.results.compute(
+                    job["project_ids"],
+                    job["version"],
+                    lambda project_ids: pool.submit(
+                        compute, project_ids, *args
+                    ).result(),
+                )
+            except Exception as e:
+                logger.exception(f"accessibility job {job['id']} failed")
+                self._save({**job, "status": FAILED, "error": str(e)})
+            else:
+                self._save({**job, "status": DONE})
+            finally:
+                self.results.store.delete(
+                    self.pending_key(job["project_ids"], job["version"])
+                )
+
+    def stats(self) -> Dict[str, int]:
+        """Submits of this process that were given a job already under way"""
+        with self._lock:
+            return {"coalesced": self._stats["coalesced"]}
+
+    def shutdown(self):
+        """Wait for the jobs submitted so far to finish"""
+        self._runner.shutdown(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,112 @@
+from datetime import date
+from decimal import Decimal
+import json
+import re
+from typing import Any
+
+from flask.json.provider import JSONProvider
+import numpy as np
+import orjson
+from werkzeug.http import http_date
+
+# sorted keys match flask's default provider, orjson only takes str keys without
+# OPT_NON_STR_KEYS while our score dicts are keyed by DA id, and dates are passed
+# through to `_default` so they are written as HTTP dates like flask does
+DEFAULT_OPTIONS = (
+    orjson.OPT_SORT_KEYS
+    | orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+_NON_ASCII = re.compile("[^\x00-\x7f]+")
+
+
+def _escape_non_ascii(encoded: bytes) -> bytes:
+    """
+    Write non-ASCII characters as `\\uXXXX` escapes like the stdlib encoder, which orjson
+    can't do itself. They can only occur in strings, so the rest is left as it is.
+    """
+    if encoded.isascii():
+        return encoded
+    return _NON_ASCII.sub(
+        lambda match: json.dumps(match.group())[1:-1], encoded.decode()
+    ).encode()
+
+
+def _default(o: Any):
+    """Serialize the types flask's default provider handles that orjson doesn't"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def round_floats(obj: Any, precision: int):
+    """Round every float in a tree of dicts, lists and numpy arrays to `precision` decimals"""
+    if isinstance(obj, float):
+        return round(obj, precision)
+    if isinstance(obj, dict):
+        return {key: round_floats(value, precision) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [round_floats(value, precision) for value in obj]
+    if isinstance(obj, np.ndarray) and obj.dtype.kind == "f":
+        return obj.round(precision)
+    return obj
+
+
+def dumps_bytes(obj: Any, precision: int | None = None, option: int = 0) -> bytes:
+    """
+    Encode to compact JSON with orjson, escaping non-ASCII characters
+
+        Args
+            obj (`Any`): the object to encode
+            precision (`int | None`): round floats to this many decimals, defaults to not rounding
+            option (`int`): orjson options on top of `DEFAULT_OPTIONS`
+
+        Returns
+            `bytes`
+    """
+    if precision is not None:
+        obj = round_floats(obj, precision)
+    return _escape_non_ascii(
+        orjson.dumps(obj, default=_default, option=DEFAULT_OPTIONS | option)
+    )
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    A drop-in for flask's default JSON provider backed by orjson. Output is compact,
+    with sorted keys and non-ASCII escaped, so it's the same as the default provider's
+    but for keys that are numbers and for floats:
+
+    - int keys are sorted as the strings they're written as, `"10"` before `"9"`
+    - `float_precision` rounds floats if set
+    - NaN and infinities are written as null, so bodies are always valid JSON
+    - floats that print with an exponent are written as orjson does, e.g. `1e16` and
+      `1e-7` rather than `1e+16` and `1e-07`, and those from 1e-5 to 1e-4 in full,
+      e.g. `0.00001` rather than `1e-05`. They decode to the same values.
+    """
+
+    float_precision: int | None = None
+    mimetype = "application/json"
+
+    def dumps_bytes(self, obj: Any, option: int = 0) -> bytes:
+        return dumps_bytes(obj, self.float_precision, option)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        # skips the str round trip of the base class, and the newline matches jsonify
+        return self._app.response_class(
+            self.dumps_bytes(obj, orjson.OPT_APPEND_NEWLINE), mimetype=self.mimetype
+        )
@@ -0,0 +1,429 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Type
+
+from geoalchemy2.elements import WKTElement
+import shapely
+from sqlalchemy import (
+    ARRAY,
+    JSON,
+    Integer,
+    Text,
+    and_,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session, aliased, outerjoin
+from sqlalchemy.sql.elements import ColumnElement
+
+from api.json_provider import dumps_bytes
+from api.models import (
+    db,
+    Arterial,
+    DisseminationArea,
+    ExistingLane,
+    Intersection,
+    SimplifiedGeometry,
+)
+from api.settings import app_settings
+from api.views import arterial_project_ids
+
+# defaults to the precision the `geojson` package rounds coordinates to
+GEOJSON_COORDINATE_PRECISION = app_settings.GEOJSON_COORDINATE_PRECISION
+
+GEOJSON_CRS = {
+    "type": "name",
+    "properties": {"name": "urn:ogc:def:crs:EPSG::4326"},
+}
+
+# rows fetched per round trip when streaming a layer
+STREAM_CHUNK_SIZE = 500
+
+# geometries are imported as lon/lat but stored without an SRID
+GEOMETRY_SRID = 4326
+STORED_SRID = 0
+WEB_MERCATOR_SRID = 3857
+
+# simplification tiers in degrees, computed at import for layers that support them
+SIMPLIFICATION_TOLERANCES = (0.0001, 0.0004, 0.0016)
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_TILE_ZOOM = 22
+
+
+@dataclass(frozen=True)
+class Layer:
+    """A map layer: the model that holds the geometry and the properties each feature carries"""
+
+    name: str
+    model: Type[db.Model]
+    properties: Dict[str, ColumnElement]
+    # whether simplified geometries are precomputed, see `build_simplified_geometries`
+    simplify: bool = False
+    # whether the features are polygons that tile an area without gaps or overlaps
+    coverage: bool = False
+
+
+LAYERS: Dict[str, Layer] = {
+    "arterials": Layer(
+        name="arterials",
+        model=Arterial,
+        properties={
+            "default_project_id": Arterial.default_project_id,
+            "total_length": Arterial.total_length,
+            "id": Arterial.id,
+            "budget_project_ids": func.coalesce(
+                select(arterial_project_ids.c.project_ids)
+                .filter(arterial_project_ids.c.arterial_id == Arterial.id)
+                .scalar_subquery(),
+                cast(literal("{}"), ARRAY(Integer)),
+            ),
+            "feature_type": literal("arterial"),
+            "GEO_ID": Arterial.GEO_ID,
+        },
+    ),
+    "existing-lanes": Layer(
+        name="existing-lanes",
+        model=ExistingLane,
+        properties={
+            "id": ExistingLane.id,
+            "total_length": ExistingLane.total_length,
+            "feature_type": literal("existing_lane"),
+            "INFRA_HIGHORDER": ExistingLane.INFRA_HIGHORDER,
+        },
+        simplify=True,
+    ),
+    "das": Layer(
+        name="das",
+        model=DisseminationArea,
+        properties={
+            "id": DisseminationArea.id,
+            "DAUID": DisseminationArea.DAUID,
+        },
+        simplify=True,
+        coverage=True,
+    ),
+    "intersections": Layer(
+        name="intersections",
+        model=Intersection,
+        properties={
+            "id": Intersection.id,
+            "INTERSECTION_ID": Intersection.INTERSECTION_ID,
+        },
+    ),
+}
+
+
+def _json_object(values: Dict[str, Any]):
+    args = []
+    for key, value in values.items():
+        args.extend([literal(key), value])
+    return func.json_build_object(*args)
+
+
+def tolerance_for_zoom(zoom: int):
+    """The width of a 256px map tile's pixel at the equator, in degrees"""
+    return 360 / (256 * 2**zoom)
+
+
+def simplification_tier(layer: Layer, tolerance: float | None) -> float | None:
+    """
+    Pick the coarsest precomputed tolerance that is still within the requested one
+
+        Args
+            layer (`Layer`): the layer to render
+            tolerance (`float | None`): the largest acceptable simplification, in degrees
+
+        Returns
+            `float | None`, the tier, or `None` if the full geometry should be used
+    """
+    if not layer.simplify or tolerance is None:
+        return None
+    tiers = [t for t in SIMPLIFICATION_TOLERANCES if t <= tolerance]
+    return max(tiers) if tiers else None
+
+
+def _layer_source(layer: Layer, tier: float | None):
+    """The FROM clause and geometry expression for a layer at a simplification tier"""
+    if tier is None:
+        return layer.model, layer.model.geometry
+
+    simplified = aliased(SimplifiedGeometry)
+    source = outerjoin(
+        layer.model,
+        simplified,
+        and_(
+            simplified.feature_id == layer.model.id,
+            simplified.layer == layer.name,
+            simplified.tolerance == tier,
+        ),
+    )
+    return source, func.coalesce(simplified.geometry, layer.model.geometry)
+
+
+def build_simplified_geometries(session: Session, layers: List[str] | None = None):
+    """
+    Replace the simplified geometries of each layer that supports them, one set per tolerance.
+    Coverages are simplified as a whole, see `_simplify_coverage`, the others one feature
+    at a time with topology-preserving simplification, so each stays valid.
+
+        Args
+            session (`Session`): the database session
+            layers (`List[str]`): the layers to simplify, defaults to all that support it
+    """
+    for name in layers or LAYERS.keys():
+        layer = LAYERS[name]
+        if not layer.simplify:
+            continue
+
+        session.execute(
+            delete(SimplifiedGeometry).filter(SimplifiedGeometry.layer == name)
+        )
+
+        if layer.coverage:
+            _simplify_coverage(session, layer)
+            continue
+
+        for tolerance in SIMPLIFICATION_TOLERANCES:
+            session.execute(
+                insert(SimplifiedGeometry).from_select(
+                    ["layer", "tolerance", "feature_id", "geometry"],
+                    select(
+                        literal(name),
+                        literal(tolerance),
+                        layer.model.id,
+                        func.ST_SimplifyPreserveTopology(
+                            layer.model.geometry, tolerance
+                        ),
+                    ),
+                )
+            )
+
+    session.commit()
+
+
+def _simplify_coverage(session: Session, layer: Layer):
+    """
+    Simplify a coverage's polygons together, so that each edge two neighbours share is
+    simplified once and they still meet along it. Simplified apart, each would cut
+    the edge its own way, leaving gaps and overlaps between them. PostGIS only has this
+    from 3.4 on (`ST_CoverageSimplify`), so it's done with the same GEOS function in shapely.
+    """
+    rows = session.execute(
+        select(layer.model.id, func.ST_AsBinary(layer.model.geometry))
+    ).all()
+
+    if not rows:
+        return
+
+    geometries = shapely.from_wkb([bytes(geometry) for _, geometry in rows])
+
+    for tolerance in SIMPLIFICATION_TOLERANCES:
+        simplified = shapely.coverage_simplify(geometries, tolerance)
+        session.execute(
+            insert(SimplifiedGeometry),
+            [
+                {
+                    "layer": layer.name,
+                    "tolerance": tolerance,
+                    "feature_id": id,
+                    "geometry": WKTElement(geometry.wkt),
+                }
+                for (id, _), geometry in zip(rows, simplified)
+            ],
+        )
+
+
+def feature_expression(layer: Layer, geometry: ColumnElement | None = None):
+    """
+    Build a single GeoJSON Feature for each row of the layer's table
+
+        Args
+            layer (`Layer`): the layer to render
+            geometry (`ColumnElement`): the geometry to render, defaults to the layer's own
+
+        Returns
+            a `json` column expression
+    """
+    if geometry is None:
+        geometry = layer.model.geometry
+
+    return _json_object(
+        {
+            "type": literal("Feature"),
+            "geometry": cast(
+                func.ST_AsGeoJSON(geometry, GEOJSON_COORDINATE_PRECISION),
+                JSON,
+            ),
+            "properties": _json_object(layer.properties),
+        }
+    )
+
+
+def spatial_filters(
+    layer: Layer,
+    bbox: Tuple[float, float, float, float] | None = None,
+    intersects: str | None = None,
+) -> List[ColumnElement]:
+    """
+    Build the criteria limiting a layer to a viewport and/or a geometry,
+    both of which can be answered from the geometry's GiST index
+
+        Args
+            layer (`Layer`): the layer to filter
+            bbox (`Tuple[float, float, float, float]`): min lon, min lat, max lon, max lat
+            intersects (`str`): a WKT geometry in lon/lat
+
+        Returns
+            `List[ColumnElement]`
+    """
+    filters = []
+
+    if bbox is not None:
+        filters.append(
+            layer.model.geometry.intersects(func.ST_MakeEnvelope(*bbox, STORED_SRID))
+        )
+
+    if intersects is not None:
+        filters.append(
+            func.ST_Intersects(
+                layer.model.geometry, func.ST_GeomFromText(intersects, STORED_SRID)
+            )
+        )
+
+    return filters
+
+
+def feature_collection_query(
+    layer: Layer, filters: Sequence[ColumnElement] = (), tier: float | None = None
+):
+    """
+    Build a statement that has PostGIS render the layer as a complete FeatureCollection,
+    so the result can be passed to the client as-is
+
+        Args
+            layer (`Layer`): the layer to render
+            filters (`Sequence[ColumnElement]`): criteria limiting the features, see `spatial_filters`
+            tier (`float | None`): the simplification tier, see `simplification_tier`
+
+        Returns
+            `Select` returning a single text value
+    """
+    source, geometry = _layer_source(layer, tier)
+
+    features = func.coalesce(
+        func.json_agg(
+            aggregate_order_by(feature_expression(layer, geometry), layer.model.id)
+        ),
+        func.json_build_array(),
+    )
+
+    collection = _json_object(
+        {
+            "type": literal("FeatureCollection"),
+            "features": features,
+            "crs": cast(literal(dumps_bytes(GEOJSON_CRS).decode()), JSON),
+        }
+    )
+
+    return select(cast(collection, Text)).select_from(source).filter(*filters)
+
+
+def stream_feature_collection(
+    session: Session,
+    layer: Layer,
+    filters: Sequence[ColumnElement] = (),
+    tier: float | None = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    Yield the layer as a FeatureCollection in chunks, reading the features through a
+    server-side cursor so neither the rows nor the body are ever held in full
+
+        Args
+            session (`Session`): the database session
+            layer (`Layer`): the layer to render
+            filters (`Sequence[ColumnElement]`): criteria limiting the features, see `spatial_filters`
+            tier (`float | None`): the simplification tier, see `simplification_tier`
+            chunk_size (`int`): the number of features per chunk
+
+        Returns
+            `Iterator[str]`, the pieces of the FeatureCollection
+    """
+    yield f'{{"type": "FeatureCollection", "crs": {dumps_bytes(GEOJSON_CRS).decode()}, "features": ['
+
+    source, geometry = _layer_source(layer, tier)
+
+    result = session.execute(
+        select(cast(feature_expression(layer, geometry), Text))
+        .select_from(source)
+        .filter(*filters)
+        .order_by(layer.model.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+
+    separator = ""
+    for partition in result.scalars().partitions():
+        yield separator + ",".join(partition)
+        separator = ","
+
+    yield "]}"
+
+
+def _tile_property(value: ColumnElement):
+    # MVT has no list type, so arrays are carried as JSON strings
+    if isinstance(value.type, ARRAY):
+        return cast(func.to_json(value), Text)
+    return value
+
+
+def tile_query(layer: Layer, z: int, x: int, y: int):
+    """
+    Build a statement that encodes the layer's features within a tile as a Mapbox Vector Tile,
+    using the simplified geometries fit for the zoom level where they exist
+
+        Args
+            layer (`Layer`): the layer to render
+            z (`int`): the zoom level
+            x (`int`): the tile column
+            y (`int`): the tile row
+
+        Returns
+            `Select` returning a single bytea value
+    """
+    envelope = func.ST_TileEnvelope(z, x, y)
+
+    # filter on the stored geometry so the spatial index can be used
+    stored_envelope = func.ST_SetSRID(
+        func.ST_Transform(envelope, GEOMETRY_SRID), STORED_SRID
+    )
+
+    source, geometry = _layer_source(
+        layer, simplification_tier(layer, tolerance_for_zoom(z))
+    )
+
+    tile_geometry = func.ST_AsMVTGeom(
+        func.ST_Transform(func.ST_SetSRID(geometry, GEOMETRY_SRID), WEB_MERCATOR_SRID),
+        envelope,
+        TILE_EXTENT,
+        TILE_BUFFER,
+    )
+
+    features = (
+        select(
+            tile_geometry.label("geom"),
+            *[_tile_property(v).label(k) for k, v in layer.properties.items()],
+        )
+        .select_from(source)
+        .filter(layer.model.geometry.intersects(stored_envelope))
+        .subquery("features")
+    )
+
+    return select(
+        func.ST_AsMVT(features.table_valued(), layer.name, TILE_EXTENT, "geom")
+    ).select_from(features)
@@ -5,11 +5,14 @@ from flask_sqlalchemy import SQLAlchemy
 from geoalchemy2 import Geometry
 from sqlalchemy import (
     Column,
+    DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     UniqueConstraint,
+    func,
 )
 from sqlalchemy.orm import Mapped
 
@@ -27,6 +30,13 @@ class BudgetProjectMember(db.Model):
     budget_id = Column(Integer, ForeignKey("budgets.id"), primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
 
+    # the primary key leads on the arterial, this serves a budget's arterials
+    __table_args__ = (
+        Index(
+            "ix_budget_project_members_budget_id", budget_id, arterial_id, project_id
+        ),
+    )
+
     budget = db.relationship("Budget")
     project = db.relationship("Project")
     arterial = db.relationship("Arterial")
@@ -184,7 +194,28 @@ class BudgetScore(db.Model):
     )
     score = Column(Float, nullable=False)
 
-    __table_args__ = (UniqueConstraint(dissemination_area_id, metric_id, budget_id),)
+    __table_args__ = (
+        UniqueConstraint(dissemination_area_id, metric_id, budget_id),
+        # the unique constraint leads on the DA, so it serves neither lookup below.
+        # Both include the score so they can be answered from the index alone.
+        # A budget's increases, by budget then by the DA and metric they're joined on
+        Index(
+            "ix_budget_scores_budget_id",
+            budget_id,
+            dissemination_area_id,
+            metric_id,
+            postgresql_include=["score"],
+            postgresql_where=budget_id != None,
+        ),
+        # the baseline, which is only ever read as `budget_id IS NULL`
+        Index(
+            "ix_budget_scores_baseline",
+            dissemination_area_id,
+            metric_id,
+            postgresql_include=["score"],
+            postgresql_where=budget_id == None,
+        ),
+    )
 
     budget = db.relationship("Budget", back_populates="scores")
     metric = db.relationship("Metric")
@@ -201,3 +232,52 @@ class Intersection(db.Model):
     CLASSIFICATION_DESC = Column(String)
     OBJECTID = Column(Integer)
     geometry = Column(Geometry("MULTIPOINT"), nullable=False)
+
+
+class SimplifiedGeometry(db.Model):
+    """Precomputed simplifications of a layer's geometries, one row per feature and tolerance"""
+
+    __tablename__ = "simplified_geometries"
+    id = Column(Integer, primary_key=True)
+    layer = Column(String, nullable=False)
+    tolerance = Column(Float, nullable=False)
+    feature_id = Column(Integer, nullable=False)
+    # only ever looked up by feature, so no spatial index
+    geometry = Column(Geometry("GEOMETRY", spatial_index=False), nullable=False)
+
+    __table_args__ = (UniqueConstraint(layer, tolerance, feature_id),)
+
+
+class DataVersion(db.Model):
+    """
+    A single-row stamp the import scripts bump whenever the served data changes,
+    used to validate client and server caches
+    """
+
+    __tablename__ = "data_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class BudgetSummary(db.Model):
+    """Citywide headline numbers of a budget, rebuilt at import by `api.summaries`"""
+
+    __tablename__ = "budget_summaries"
+    budget_id = Column(Integer, ForeignKey("budgets.id"), primary_key=True)
+    arterial_count = Column(Integer, nullable=False)
+    arterial_km = Column(Float, nullable=False)
+    # DAs where any metric increases
+    das_improved = Column(Integer, nullable=False)
+
+
+class BudgetMetricSummary(db.Model):
+    """A budget's increase in one metric, summed over the city"""
+
+    __tablename__ = "budget_metric_summaries"
+    budget_id = Column(Integer, ForeignKey("budgets.id"), primary_key=True)
+    metric_id = Column(Integer, ForeignKey("metrics.id"), primary_key=True)
+    total_increase = Column(Float, nullable=False)
+    das_improved = Column(Integer, nullable=False)
@@ -0,0 +1,172 @@
+# Core selects for the read endpoints: each fetches only the columns its endpoint
+# serializes and returns them as plain named tuples, skipping ORM hydration
+
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from api.layers import GEOMETRY_SRID
+from api.models import (
+    Arterial,
+    Budget,
+    BudgetProjectMember,
+    DataVersion,
+    DisseminationArea,
+    Metric,
+)
+
+
+class BudgetRow(NamedTuple):
+    id: int
+    name: str
+
+
+class MetricRow(NamedTuple):
+    id: int
+    name: str
+
+
+class BudgetMemberRow(NamedTuple):
+    arterial_id: int
+    budget_id: int
+    project_id: int
+
+
+class DataVersionRow(NamedTuple):
+    version: int
+    updated_at: datetime
+
+
+def fetch_budgets(session: Session) -> List[BudgetRow]:
+    return [
+        BudgetRow._make(row)
+        for row in session.execute(select(Budget.id, Budget.name).order_by(Budget.id))
+    ]
+
+
+def budget_exists(session: Session, budget_id: int) -> bool:
+    return (
+        session.execute(select(Budget.id).filter(Budget.id == budget_id)).scalar()
+        is not None
+    )
+
+
+def fetch_metrics(session: Session) -> List[MetricRow]:
+    return [
+        MetricRow._make(row)
+        for row in session.execute(select(Metric.id, Metric.name).order_by(Metric.id))
+    ]
+
+
+def fetch_budget_members(session: Session, budget_id: int) -> List[BudgetMemberRow]:
+    return fetch_budgets_members(session, [budget_id])
+
+
+def fetch_budgets_members(
+    session: Session, budget_ids: Iterable[int] | None = None
+) -> List[BudgetMemberRow]:
+    """
+    Fetch the arterials of several budgets in one query
+
+        Args
+            session (`Session`): the database session
+            budget_ids (`Iterable[int] | None`): the budgets, defaults to all of them
+
+        Returns
+            `List[BudgetMemberRow]`
+    """
+    query = select(
+        BudgetProjectMember.arterial_id,
+        BudgetProjectMember.budget_id,
+        BudgetProjectMember.project_id,
+    )
+    if budget_ids is not None:
+        query = query.filter(BudgetProjectMember.budget_id.in_(list(budget_ids)))
+    return [BudgetMemberRow._make(row) for row in session.execute(query)]
+
+
+def fetch_budget_ids(session: Session, budget_ids: Iterable[int] | None = None):
+    """The ids of the budgets that exist, out of `budget_ids` if given"""
+    query = select(Budget.id).order_by(Budget.id)
+    if budget_ids is not None:
+        query = query.filter(Budget.id.in_(list(budget_ids)))
+    return list(session.execute(query).scalars())
+
+
+def group_members_by_budget(
+    rows: Iterable[BudgetMemberRow], budget_ids: Iterable[int]
+) -> Dict[int, List[Dict[str, int]]]:
+    grouped: Dict[int, List[Dict[str, int]]] = {id: [] for id in budget_ids}
+    for row in rows:
+        grouped[row.budget_id].append(row._asdict())
+    return grouped
+
+
+def fetch_da_origin_map(session: Session) -> Dict[int, int]:
+    """Map the accessibility study's origin ids to DA ids"""
+    return {
+        origin_id: da_id
+        for origin_id, da_id in session.execute(
+            select(DisseminationArea.origin_id, DisseminationArea.id).filter(
+                DisseminationArea.origin_id != None
+            )
+        )
+    }
+
+
+def _geography(geometry):
+    """Geometries are stored in lon/lat, distances between geographies are in meters"""
+    return func.geography(func.ST_SetSRID(geometry, GEOMETRY_SRID))
+
+
+def fetch_affected_origins(
+    session: Session, project_id: int, reach_meters: float
+) -> List[int]:
+    """
+    The origins whose accessibility a project can change: those of the DAs within
+    a trip's reach of any of its arterials, whether by default or through a budget
+
+        Args
+            session (`Session`): the database session
+            project_id (`int`): the project
+            reach_meters (`float`): the longest trip the accessibility engine counts
+
+        Returns
+            `List[int]`, origin ids
+    """
+    arterials = (
+        select(Arterial.geometry)
+        .filter(
+            or_(
+                Arterial.default_project_id == project_id,
+                Arterial.id.in_(
+                    select(BudgetProjectMember.arterial_id).filter(
+                        BudgetProjectMember.project_id == project_id
+                    )
+                ),
+            )
+        )
+        .subquery()
+    )
+    return list(
+        session.execute(
+            select(DisseminationArea.origin_id)
+            .distinct()
+            .join(
+                arterials,
+                func.ST_DWithin(
+                    _geography(DisseminationArea.geometry),
+                    _geography(arterials.c.geometry),
+                    reach_meters,
+                ),
+            )
+            .filter(DisseminationArea.origin_id != None)
+        ).scalars()
+    )
+
+
+def fetch_data_version(session: Session) -> DataVersionRow | None:
+    row = session.execute(select(DataVersion.version, DataVersion.updated_at)).first()
+    return DataVersionRow._make(row) if row else None
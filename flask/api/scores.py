@@ -0,0 +1,481 @@
+from dataclasses import dataclass
+import json
+import struct
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, Text, and_, cast, func, literal, select
+from sqlalchemy.orm import Session, aliased
+
+from api.models import Budget, BudgetScore, Metric
+from api.views import baseline_score_pivot
+
+
+# the derived score types of a budget, in the order they're served
+SCORE_TYPES = ["budget", "original", "diff", "bin"]
+
+# score types that hold whole numbers
+INTEGER_SCORE_TYPES = ["diff", "bin"]
+
+SCORE_FORMATS = ["json", "columnar", "binary"]
+
+BINARY_SCORES_MIMETYPE = "application/octet-stream"
+
+
+@dataclass(frozen=True, eq=False)
+class ScoreColumns:
+    """
+    Scores laid out by column: the DA ids and, for each score type, a [metric, DA]
+    array in which missing scores are NaN
+    """
+
+    da_ids: np.ndarray
+    metrics: List[str]
+    scores: Dict[str, np.ndarray]
+
+    def _python_values(self):
+        """The score arrays as nested lists, so serializing doesn't go through numpy per value"""
+        return {
+            score_type: (
+                # ints, as `int(score)` gave them, with the missing ones zeroed to cast cleanly
+                np.where(np.isnan(values), 0, values).astype(np.int64)
+                if score_type in INTEGER_SCORE_TYPES
+                else values
+            ).tolist()
+            for score_type, values in self.scores.items()
+        }
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """The scores in the shape of `DaScoreResult.to_dict`, leaving out missing ones"""
+        present = ~np.isnan(self.scores["original"])
+        columns = self._python_values()
+
+        result = {}
+        for col, da_id in enumerate(self.da_ids.tolist()):
+            rows = [row for row in range(len(self.metrics)) if present[row, col]]
+            result[str(da_id)] = {
+                "da": da_id,
+                "scores": {
+                    score_type: {self.metrics[row]: values[row][col] for row in rows}
+                    for score_type, values in columns.items()
+                },
+            }
+
+        return result
+
+    def to_columnar(self) -> Dict[str, Any]:
+        """
+        The scores as JSON-ready columns, one list per score type and metric,
+        aligned with `da_ids` and with `None` for missing scores
+        """
+
+        def column(score_type: str, values: np.ndarray):
+            missing = np.isnan(values)
+            if score_type in INTEGER_SCORE_TYPES:
+                values = np.where(missing, 0, values).astype(np.int64)
+            if missing.any():
+                return np.where(missing, None, values.astype(object)).tolist()
+            return values.tolist()
+
+        return {
+            "da_ids": self.da_ids.tolist(),
+            "metrics": self.metrics,
+            "scores": {
+                score_type: {
+                    metric: column(score_type, values[row])
+                    for row, metric in enumerate(self.metrics)
+                }
+                for score_type, values in self.scores.items()
+            },
+        }
+
+    def to_binary(self, summary: Dict[str, Any] | None = None) -> bytes:
+        """
+        The scores as little-endian typed arrays behind a JSON header:
+
+            uint32      length of the header in bytes, padded to a multiple of 4
+            header      JSON, {"da_count", "metrics", "score_types"} and "summary" if given
+            int32       da ids, `da_count` of them
+            float32     scores, by score type, then metric, then DA, NaN where missing
+
+        so that every array starts on a 4 byte boundary and can be viewed in place
+        """
+        header = {
+            "da_count": len(self.da_ids),
+            "metrics": self.metrics,
+            "score_types": list(self.scores.keys()),
+        }
+        if summary is not None:
+            header["summary"] = summary
+        header = json.dumps(header).encode()
+        header += b" " * (-len(header) % 4)
+
+        values = np.stack(list(self.scores.values())) if self.scores else np.empty(0)
+
+        return b"".join(
+            [
+                struct.pack("<I", len(header)),
+                header,
+                self.da_ids.astype("<i4").tobytes(),
+                values.astype("<f4").tobytes(),
+            ]
+        )
+
+
+def changed_das(columns: ScoreColumns) -> ScoreColumns:
+    """
+    Keep only the DAs whose score changed for some metric, i.e. whose budget score
+    differs from the original one. The rest can be filled in from `/default-scores`.
+    """
+    with np.errstate(invalid="ignore"):
+        keep = (columns.scores["budget"] != columns.scores["original"]).any(axis=0)
+    return ScoreColumns(
+        da_ids=columns.da_ids[keep],
+        metrics=columns.metrics,
+        scores={
+            score_type: values[:, keep] for score_type, values in columns.scores.items()
+        },
+    )
+
+
+def summarize(columns: ScoreColumns) -> Dict[str, Any]:
+    """
+    The stats a client needs to render a budget when it only has the changed DAs:
+    the DA counts and the range and total of each score type for each metric
+
+        Args
+            columns (`ScoreColumns`): the scores of every DA
+
+        Returns
+            `Dict[str, Any]`
+    """
+
+    def stats(values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {"min": None, "max": None, "total": 0}
+        return {
+            "min": values.min().item(),
+            "max": values.max().item(),
+            "total": values.sum().item(),
+        }
+
+    return {
+        "da_count": len(columns.da_ids),
+        "changed_count": len(changed_das(columns).da_ids),
+        "metrics": {
+            metric: {
+                score_type: stats(values[row])
+                for score_type, values in columns.scores.items()
+            }
+            for row, metric in enumerate(columns.metrics)
+        },
+    }
+
+
+@dataclass(frozen=True, eq=False)
+class ScoreCube:
+    """
+    Every score held in memory as a dense array of shape [budget, metric, DA],
+    where missing scores are NaN
+    """
+
+    # budget ids in cube order, the first is `None`, the existing network
+    budget_ids: List[int | None]
+    metrics: List[str]
+    da_ids: np.ndarray
+    values: np.ndarray
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "_budget_index", {id: i for i, id in enumerate(self.budget_ids)}
+        )
+
+    def has_budget(self, budget_id: int):
+        return budget_id in self._budget_index
+
+    def scores(self, budget_id: int | None) -> np.ndarray:
+        """The [metric, DA] slice of a budget, or of the baseline if `budget_id` is `None`"""
+        return self.values[self._budget_index[budget_id]]
+
+    def baseline_scores(self, metric: str, da_ids: Sequence[int]) -> np.ndarray:
+        """A metric's baseline score for each of `da_ids`, NaN where there is none"""
+        da_ids = np.asarray(da_ids, dtype=np.int64)
+        result = np.full(len(da_ids), np.nan)
+        if metric not in self.metrics or not len(self.da_ids):
+            return result
+
+        # da_ids are sorted, see `load_score_cube`
+        positions = np.searchsorted(self.da_ids, da_ids).clip(max=len(self.da_ids) - 1)
+        found = self.da_ids[positions] == da_ids
+        result[found] = self.scores(None)[self.metrics.index(metric), positions[found]]
+        return result
+
+    def baseline_dict(self) -> Dict[int, Dict[str, Any]]:
+        """The baseline scores in the shape served by `/default-scores`"""
+        baseline = self.scores(None)
+        present = ~np.isnan(baseline)
+        values = baseline.tolist()
+
+        result = {}
+        for col in np.flatnonzero(present.any(axis=0)):
+            da_id = int(self.da_ids[col])
+            scores = {
+                metric: values[row][col]
+                for row, metric in enumerate(self.metrics)
+                if present[row, col]
+            }
+            result[da_id] = {**scores, "da": da_id}
+
+        return result
+
+    def baseline_columns(self) -> ScoreColumns:
+        """The baseline scores of every DA that has one, as the `original` score type"""
+        baseline = self.scores(None)
+        keep = (~np.isnan(baseline)).any(axis=0)
+        return ScoreColumns(
+            da_ids=self.da_ids[keep],
+            metrics=self.metrics,
+            scores={"original": baseline[:, keep]},
+        )
+
+    def budget_columns(self, budget_id: int) -> ScoreColumns:
+        """A budget's derived scores for every DA it has scores for"""
+        arrays = self.budget_arrays(budget_id)
+        present = arrays.pop("present")
+        keep = present.any(axis=0)
+        return ScoreColumns(
+            da_ids=self.da_ids[keep],
+            metrics=self.metrics,
+            scores={
+                score_type: np.where(present, arrays[score_type], np.nan)[:, keep]
+                for score_type in SCORE_TYPES
+            },
+        )
+
+    def budget_arrays(self, budget_id: int) -> Dict[str, np.ndarray]:
+        """
+        Compute the derived scores of a budget for every DA at once
+
+            Args
+                budget_id (`int`): the budget
+
+            Returns
+                `Dict[str, np.ndarray]`, with a [metric, DA] array per score type and a
+                mask of the scores that exist
+        """
+        increase = self.scores(budget_id)
+        original = self.scores(None)
+
+        present = ~np.isnan(increase) & ~np.isnan(original)
+        # NaNs are masked out, so don't let them warn on the way
+        with np.errstate(invalid="ignore"):
+            return {
+                "budget": increase + original,
+                "original": original,
+                "diff": np.trunc(increase),
+                "bin": (increase > original).astype(np.int8),
+                "present": present,
+            }
+
+    def budget_dict(self, budget_id: int) -> Dict[str, Dict[str, Any]]:
+        """A budget's scores in the shape of `DaScoreResult.to_dict`"""
+        return self.budget_columns(budget_id).to_dict()
+
+
+def load_score_cube(session: Session) -> ScoreCube:
+    """
+    Read every score in a single query and scatter it into a `ScoreCube`
+
+        Args
+            session (`Session`): the database session
+
+        Returns
+            `ScoreCube`
+    """
+    budget_ids = [None] + list(
+        session.execute(select(Budget.id).order_by(Budget.id)).scalars()
+    )
+    metrics = list(session.execute(select(Metric.name).order_by(Metric.id)).scalars())
+
+    rows = session.execute(
+        select(
+            BudgetScore.budget_id,
+            Metric.name,
+            BudgetScore.dissemination_area_id,
+            BudgetScore.score,
+        ).join(Metric, Metric.id == BudgetScore.metric_id)
+    ).all()
+
+    budget_index = {id: i for i, id in enumerate(budget_ids)}
+    metric_index = {name: i for i, name in enumerate(metrics)}
+
+    if rows:
+        budget_col, metric_col, da_col, score_col = zip(*rows)
+    else:
+        budget_col, metric_col, da_col, score_col = (), (), (), ()
+
+    da_ids, da_col = np.unique(np.array(da_col, dtype=np.int64), return_inverse=True)
+
+    values = np.full((len(budget_ids), len(metrics), len(da_ids)), np.nan)
+    values[
+        [budget_index[id] for id in budget_col],
+        [metric_index[name] for name in metric_col],
+        da_col,
+    ] = np.array(score_col, dtype=np.float64)
+
+    # increases of zero aren't stored, so wherever there's a baseline a missing one is 0
+    values[1:] = np.where(np.isnan(values[1:]) & ~np.isnan(values[0]), 0.0, values[1:])
+
+    return ScoreCube(
+        budget_ids=budget_ids, metrics=metrics, da_ids=da_ids, values=values
+    )
+
+
+def _budget_payloads(budget_ids: List[int] | None):
+    """
+    A subquery of (budget_id, scores) that joins each budget's score increases to the
+    baseline, derives each score type and aggregates the result into the
+    `DaScoreResult.to_dict` shape, so the database returns the finished payloads.
+    Increases of zero aren't stored, so every DA with a baseline is included and a
+    missing increase counts as zero.
+    """
+    base = aliased(BudgetScore)
+    increase = aliased(BudgetScore)
+    score = func.coalesce(increase.score, 0.0)
+
+    increase_of_budget = [
+        increase.budget_id == Budget.id,
+        increase.dissemination_area_id == base.dissemination_area_id,
+        increase.metric_id == base.metric_id,
+    ]
+    if budget_ids is not None:
+        # postgres doesn't carry the filter on `Budget.id` over to the increases, which
+        # it needs to look them up in `ix_budget_scores_budget_id`
+        increase_of_budget.append(increase.budget_id.in_(budget_ids))
+
+    def by_metric(value):
+        return func.json_object_agg(Metric.name, value)
+
+    per_da = (
+        select(
+            Budget.id.label("budget_id"),
+            base.dissemination_area_id.label("da"),
+            func.json_build_object(
+                literal("da"),
+                base.dissemination_area_id,
+                literal("scores"),
+                func.json_build_object(
+                    literal("budget"),
+                    by_metric(score + base.score),
+                    literal("original"),
+                    by_metric(base.score),
+                    literal("diff"),
+                    by_metric(cast(func.trunc(score), BigInteger)),
+                    literal("bin"),
+                    by_metric(cast(score > base.score, Integer)),
+                ),
+            ).label("scores"),
+        )
+        .select_from(Budget)
+        .join(base, base.budget_id == None)
+        .join(Metric, Metric.id == base.metric_id)
+        .outerjoin(increase, and_(*increase_of_budget))
+        .group_by(Budget.id, base.dissemination_area_id)
+    )
+
+    if budget_ids is not None:
+        per_da = per_da.filter(Budget.id.in_(budget_ids))
+
+    per_da = per_da.subquery("per_da")
+
+    return (
+        select(
+            per_da.c.budget_id,
+            func.json_object_agg(per_da.c.da, per_da.c.scores).label("scores"),
+        )
+        .group_by(per_da.c.budget_id)
+        .subquery("per_budget")
+    )
+
+
+def fetch_baseline_scores(session: Session) -> Dict[int, Dict[str, Any]]:
+    """
+    The `/default-scores` payload, read from the `baseline_score_pivot` materialized
+    view, one row per DA
+
+        Args
+            session (`Session`): the database session
+
+        Returns
+            `Dict[int, Dict[str, Any]]`, each DA's scores by metric and its id under `da`
+    """
+    pivot = baseline_score_pivot
+    return {
+        da_id: {**scores, "da": da_id}
+        for da_id, scores in session.execute(
+            select(pivot.c.dissemination_area_id, pivot.c.scores)
+        )
+    }
+
+
+def budget_scores_query(budget_id: int):
+    """
+    Build a statement that has postgres render a budget's scores payload, see `_budget_payloads`
+
+        Args
+            budget_id (`int`): the budget
+
+        Returns
+            `Select` returning the payload as text, or no row if the budget doesn't exist
+    """
+    payloads = _budget_payloads([budget_id])
+
+    return (
+        select(cast(func.coalesce(payloads.c.scores, func.json_build_object()), Text))
+        .select_from(Budget)
+        .outerjoin(payloads, payloads.c.budget_id == Budget.id)
+        .filter(Budget.id == budget_id)
+    )
+
+
+def budgets_scores_query(budget_ids: List[int] | None = None):
+    """
+    Build a statement that renders the scores payloads of several budgets at once,
+    joining the baseline in a single pass
+
+        Args
+            budget_ids (`List[int] | None`): the budgets, defaults to all of them
+
+        Returns
+            `Select` returning the payloads as text, keyed by budget id, and the ids found
+    """
+    payloads = _budget_payloads(budget_ids)
+
+    query = (
+        select(
+            cast(
+                func.coalesce(
+                    func.json_object_agg(
+                        Budget.id,
+                        func.coalesce(payloads.c.scores, func.json_build_object()),
+                    ),
+                    func.json_build_object(),
+                ),
+                Text,
+            ),
+            func.array_agg(Budget.id),
+        )
+        .select_from(Budget)
+        .outerjoin(payloads, payloads.c.budget_id == Budget.id)
+    )
+
+    if budget_ids is not None:
+        query = query.filter(Budget.id.in_(budget_ids))
+
+    return query
+
+
+def render_budgets_scores(session: Session, budget_ids: List[int] | None = None):
+    """The scores payloads of several budgets as JSON text keyed by budget id"""
+    return session.execute(budgets_scores_query(budget_ids)).first()[0]
@@ -1,4 +1,5 @@
-from os import getenv
+from os import cpu_count, getenv, path
+from tempfile import gettempdir
 from dataclasses import dataclass
 from sqlalchemy.engine.url import URL
 
@@ -22,6 +23,42 @@ class _AppSettings:
         database=getenv("TEST_DB_NAME"),
     )
     TEST_DB_NAME = getenv("TEST_DB_NAME")
+    STREAM_LAYERS = True if getenv("STREAM_LAYERS") == "true" else False
+    ARTIFACT_DIR = getenv(
+        "ARTIFACT_DIR", path.join(path.dirname(path.dirname(__file__)), "artifacts")
+    )
+    # any flask-caching backend will do, as long as all workers share it
+    CACHE_TYPE = getenv("CACHE_TYPE", "FileSystemCache")
+    CACHE_DIR = getenv(
+        "CACHE_DIR", path.join(path.dirname(path.dirname(__file__)), "cache")
+    )
+    CACHE_THRESHOLD = int(getenv("CACHE_THRESHOLD", 10000))
+    # accessibility results each worker keeps in memory, see `api.accessibility`
+    ACCESSIBILITY_MEMORY_ENTRIES = int(getenv("ACCESSIBILITY_MEMORY_ENTRIES", 32))
+    # lock files that let the workers share a computation, see `api.accessibility`
+    LOCK_DIR = getenv("LOCK_DIR", path.join(gettempdir(), "cyclelinx-locks"))
+    # gunicorn workers, gunicorn reads the same variable when it isn't given `-w`
+    WEB_CONCURRENCY = int(getenv("WEB_CONCURRENCY", 1))
+    # processes each worker runs accessibility jobs on, see `api.jobs`, by default
+    # the workers' pools split the cores between them
+    ACCESSIBILITY_POOL_SIZE = int(
+        getenv("ACCESSIBILITY_POOL_SIZE", max(1, (cpu_count() or 1) // WEB_CONCURRENCY))
+    )
+    # the longest trip, in meters, the accessibility engine counts: origins further than
+    # this from a project can't be affected by it. Incremental recomputation calls the
+    # engine with `origin_ids`, so the app refuses to start with it set for an engine
+    # that doesn't take them
+    ACCESSIBILITY_REACH_METERS = (
+        float(getenv("ACCESSIBILITY_REACH_METERS"))
+        if getenv("ACCESSIBILITY_REACH_METERS")
+        else None
+    )
+    # decimals floats are rounded to in JSON responses, unset keeps full precision
+    JSON_FLOAT_PRECISION = (
+        int(getenv("JSON_FLOAT_PRECISION")) if getenv("JSON_FLOAT_PRECISION") else None
+    )
+    # decimals of GeoJSON coordinates, 6 is ~10cm
+    GEOJSON_COORDINATE_PRECISION = int(getenv("GEOJSON_COORDINATE_PRECISION", 6))
 
 
 app_settings = _AppSettings()
@@ -0,0 +1,194 @@
+# Citywide headline numbers per budget: the arterials it builds and, for each metric,
+# the total increase and the number of DAs that improve. Those of the stored budgets
+# are derived once at import time, those of ad-hoc accessibility results on the fly.
+
+from typing import Any, Dict
+
+import numpy as np
+from sqlalchemy import and_, delete, distinct, func, insert, select, true
+from sqlalchemy.orm import Session, aliased
+
+from api.models import (
+    Arterial,
+    Budget,
+    BudgetMetricSummary,
+    BudgetProjectMember,
+    BudgetScore,
+    BudgetSummary,
+    Metric,
+)
+from api.scores import ScoreColumns
+
+METERS_PER_KM = 1000
+
+
+def build_budget_summaries(session: Session):
+    """
+    Rebuild the summary tables from `budget_scores`, `budget_project_members` and
+    the arterials' lengths. Run after the improvements and scores are imported.
+
+        Args
+            session (`Session`): the database session
+    """
+    session.execute(delete(BudgetMetricSummary))
+    session.execute(delete(BudgetSummary))
+
+    # an arterial can be in a budget through more than one project
+    members = (
+        select(BudgetProjectMember.budget_id, BudgetProjectMember.arterial_id)
+        .distinct()
+        .subquery()
+    )
+    arterials = (
+        select(
+            members.c.budget_id,
+            func.count().label("arterial_count"),
+            func.sum(Arterial.total_length).label("total_length"),
+        )
+        .select_from(members)
+        .join(Arterial, Arterial.id == members.c.arterial_id)
+        .group_by(members.c.budget_id)
+        .subquery()
+    )
+    # like the score routes, only count DAs that have a baseline
+    baseline = aliased(BudgetScore)
+    increases = (
+        select(
+            BudgetScore.budget_id,
+            BudgetScore.metric_id,
+            BudgetScore.dissemination_area_id,
+            BudgetScore.score,
+        )
+        .join(
+            baseline,
+            and_(
+                baseline.budget_id == None,
+                baseline.dissemination_area_id == BudgetScore.dissemination_area_id,
+                baseline.metric_id == BudgetScore.metric_id,
+            ),
+        )
+        .filter(BudgetScore.budget_id != None)
+        .subquery()
+    )
+    improved = (
+        select(
+            increases.c.budget_id,
+            func.count(distinct(increases.c.dissemination_area_id)).label(
+                "das_improved"
+            ),
+        )
+        .filter(increases.c.score > 0)
+        .group_by(increases.c.budget_id)
+        .subquery()
+    )
+
+    session.execute(
+        insert(BudgetSummary).from_select(
+            ["budget_id", "arterial_count", "arterial_km", "das_improved"],
+            select(
+                Budget.id,
+                func.coalesce(arterials.c.arterial_count, 0),
+                func.coalesce(arterials.c.total_length, 0) / METERS_PER_KM,
+                func.coalesce(improved.c.das_improved, 0),
+            )
+            .select_from(Budget)
+            .outerjoin(arterials, arterials.c.budget_id == Budget.id)
+            .outerjoin(improved, improved.c.budget_id == Budget.id),
+        )
+    )
+
+    # every budget gets a row for every metric, even if none of its DAs improve
+    session.execute(
+        insert(BudgetMetricSummary).from_select(
+            ["budget_id", "metric_id", "total_increase", "das_improved"],
+            select(
+                Budget.id,
+                Metric.id,
+                func.coalesce(func.sum(increases.c.score), 0),
+                func.count().filter(increases.c.score > 0),
+            )
+            .select_from(Budget)
+            .join(Metric, true())
+            .outerjoin(
+                increases,
+                and_(
+                    increases.c.budget_id == Budget.id,
+                    increases.c.metric_id == Metric.id,
+                ),
+            )
+            .group_by(Budget.id, Metric.id),
+        )
+    )
+
+    session.commit()
+
+
+def fetch_budget_summaries(session: Session) -> Dict[int, Dict[str, Any]]:
+    """
+    The summaries of every budget, keyed by budget id
+
+        Args
+            session (`Session`): the database session
+
+        Returns
+            `Dict[int, Dict[str, Any]]`
+    """
+    summaries = {
+        budget_id: {
+            "name": name,
+            "arterial_count": arterial_count,
+            "arterial_km": arterial_km,
+            "das_improved": das_improved,
+            "metrics": {},
+        }
+        for budget_id, name, arterial_count, arterial_km, das_improved in session.execute(
+            select(
+                BudgetSummary.budget_id,
+                Budget.name,
+                BudgetSummary.arterial_count,
+                BudgetSummary.arterial_km,
+                BudgetSummary.das_improved,
+            ).join(Budget, Budget.id == BudgetSummary.budget_id)
+        )
+    }
+
+    for budget_id, metric, total_increase, das_improved in session.execute(
+        select(
+            BudgetMetricSummary.budget_id,
+            Metric.name,
+            BudgetMetricSummary.total_increase,
+            BudgetMetricSummary.das_improved,
+        ).join(Metric, Metric.id == BudgetMetricSummary.metric_id)
+    ):
+        summaries[budget_id]["metrics"][metric] = {
+            "total_increase": total_increase,
+            "das_improved": das_improved,
+        }
+
+    return summaries
+
+
+def summarize_increases(columns: ScoreColumns) -> Dict[str, Any]:
+    """
+    The score part of a budget summary, for scores that aren't stored, e.g. the result
+    of an `/accessibility` request
+
+        Args
+            columns (`ScoreColumns`): the scores of every DA
+
+        Returns
+            `Dict[str, Any]`, with `das_improved` and `metrics` as in `fetch_budget_summaries`
+    """
+    increases = np.nan_to_num(columns.scores["budget"] - columns.scores["original"])
+    improved = increases > 0
+
+    return {
+        "das_improved": int(improved.any(axis=0).sum()),
+        "metrics": {
+            metric: {
+                "total_increase": increases[row].sum().item(),
+                "das_improved": int(improved[row].sum()),
+            }
+            for row, metric in enumerate(columns.metrics)
+        },
+    }
@@ -0,0 +1,204 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+import orjson
+from sqlalchemy import Text, cast, select
+from sqlalchemy.orm import Session
+
+from api.json_provider import dumps_bytes
+from api.layers import Layer, feature_expression
+
+# number of distinct values per axis after quantization; for a city-sized extent
+# this is a grid of well under a meter
+DEFAULT_QUANTIZATION = 100_000
+
+Point = Tuple[int, int]
+
+
+def _quantizer(features: List[Dict[str, Any]], quantization: int):
+    xs, ys = [], []
+    for feature in features:
+        for ring in _rings(feature["geometry"]):
+            for x, y in ring:
+                xs.append(x)
+                ys.append(y)
+
+    x0, x1 = (min(xs), max(xs)) if xs else (0, 0)
+    y0, y1 = (min(ys), max(ys)) if ys else (0, 0)
+    kx = (x1 - x0) / (quantization - 1) or 1
+    ky = (y1 - y0) / (quantization - 1) or 1
+
+    def quantize(ring: List[List[float]]) -> List[Point]:
+        points = []
+        for x, y in ring:
+            point = (round((x - x0) / kx), round((y - y0) / ky))
+            # points that land in the same cell are redundant
+            if not points or points[-1] != point:
+                points.append(point)
+        return points
+
+    return quantize, {"scale": [kx, ky], "translate": [x0, y0]}, [x0, y0, x1, y1]
+
+
+def _rings(geometry: Dict[str, Any]) -> Iterable[List[List[float]]]:
+    if geometry["type"] == "Polygon":
+        yield from geometry["coordinates"]
+    elif geometry["type"] == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            yield from polygon
+    else:
+        raise ValueError(f"Unsupported geometry type {geometry['type']}!")
+
+
+def _polygons(geometry: Dict[str, Any]) -> List[List[List[List[float]]]]:
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def _find_junctions(rings: List[List[Point]]):
+    """
+    A point is a junction if it's shared by rings that go different ways from it,
+    i.e. it's where a shared boundary starts or ends
+    """
+    neighbors: Dict[Point, frozenset] = {}
+    junctions = set()
+
+    for ring in rings:
+        # rings are closed, so the last point repeats the first
+        n = len(ring) - 1
+        for i in range(n):
+            point = ring[i]
+            around = frozenset((ring[i - 1 if i else n - 1], ring[i + 1]))
+            seen = neighbors.get(point)
+            if seen is None:
+                neighbors[point] = around
+            elif seen != around:
+                junctions.add(point)
+
+    return junctions
+
+
+def _cut(ring: List[Point], junctions: set) -> List[List[Point]]:
+    """Split a closed ring into arcs that start and end at junctions"""
+    n = len(ring) - 1
+    starts = [i for i in range(n) if ring[i] in junctions]
+
+    if not starts:
+        # rotate to the smallest point so an identical ring elsewhere yields the same arc
+        start = min(range(n), key=lambda i: ring[i])
+        return [ring[start:n] + ring[: start + 1]]
+
+    rotated = ring[starts[0] : n] + ring[: starts[0] + 1]
+    offsets = [i - starts[0] for i in starts] + [n]
+    return [rotated[a : b + 1] for a, b in zip(offsets, offsets[1:])]
+
+
+def _delta_encode(arc: List[Point]) -> List[List[int]]:
+    encoded = [list(arc[0])]
+    for (x0, y0), (x1, y1) in zip(arc, arc[1:]):
+        encoded.append([x1 - x0, y1 - y0])
+    return encoded
+
+
+def topology(
+    features: List[Dict[str, Any]],
+    object_name: str,
+    quantization: int = DEFAULT_QUANTIZATION,
+) -> Dict[str, Any]:
+    """
+    Convert (Multi)Polygon GeoJSON features to a quantized, delta-encoded TopoJSON topology
+    in which each boundary shared by neighbouring polygons is stored once
+
+        Args
+            features (`List[Dict[str, Any]]`): GeoJSON features
+            object_name (`str`): the name of the collection in the topology's `objects`
+            quantization (`int`): the number of distinct values per axis
+
+        Returns
+            `Dict[str, Any]`, the topology
+    """
+    quantize, transform, bbox = _quantizer(features, quantization)
+
+    def quantize_polygon(polygon: List[List[List[float]]]):
+        # rings that collapse to nothing when quantized are dropped,
+        # and the polygon goes with its exterior ring
+        rings = [quantize(ring) for ring in polygon]
+        if len(rings[0]) < 4:
+            return None
+        return [rings[0]] + [ring for ring in rings[1:] if len(ring) >= 4]
+
+    # feature => polygon => ring
+    quantized = [
+        [
+            q
+            for q in (quantize_polygon(p) for p in _polygons(feature["geometry"]))
+            if q is not None
+        ]
+        for feature in features
+    ]
+
+    junctions = _find_junctions(
+        [ring for polygons in quantized for polygon in polygons for ring in polygon]
+    )
+
+    arcs: List[List[Point]] = []
+    arc_index: Dict[Tuple[Point, ...], int] = {}
+
+    def index_of(arc: List[Point]):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reversed_key = key[::-1]
+        if reversed_key in arc_index:
+            # negative indices are one's complement and mean the arc is reversed
+            return ~arc_index[reversed_key]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    geometries = []
+    for feature, polygons in zip(features, quantized):
+        polygon_arcs = [
+            [[index_of(arc) for arc in _cut(ring, junctions)] for ring in polygon]
+            for polygon in polygons
+        ]
+        geometries.append(
+            {
+                "type": "MultiPolygon",
+                "arcs": polygon_arcs,
+                "properties": feature.get("properties", {}),
+            }
+        )
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": transform,
+        "objects": {
+            object_name: {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": [_delta_encode(arc) for arc in arcs],
+    }
+
+
+def render_topology(session: Session, layer: Layer):
+    """
+    Build the TopoJSON topology of a polygon layer from its full-detail geometries
+
+        Args
+            session (`Session`): the database session
+            layer (`Layer`): the layer to render, its name is the collection's name
+
+        Returns
+            `str`, the topology as JSON
+    """
+    features = [
+        orjson.loads(feature)
+        for feature in session.execute(
+            select(cast(feature_expression(layer), Text))
+            .select_from(layer.model)
+            .order_by(layer.model.id)
+        ).scalars()
+    ]
+
+    return dumps_bytes(topology(features, layer.name)).decode()
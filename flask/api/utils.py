@@ -1,16 +1,18 @@
-from collections import defaultdict
 from logging import getLogger
 from pathlib import Path
 import tarfile
 import tempfile
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Sequence
 
 import geojson
+import numpy as np
 from shapely import to_geojson, wkb
 from sqlalchemy import inspect
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.ext.hybrid import hybrid_property
 
+from api.scores import ScoreColumns
+
 logger = getLogger(__name__)
 
 
@@ -94,50 +96,113 @@ def extract_files(path: str):
     return tempdir
 
 
-# d-dicts must have module-level constructors to be pickled by cache
-def score_dd_constructor():
-    return {
-        "da": None,
-        "scores": {"budget": {}, "original": {}, "diff": {}, "bin": {}},
-    }
-
-
 class DaScoreResult:
-    def __init__(self):
-        self.scores = defaultdict(score_dd_constructor)
-
-    def add_da_metric(self, da_id: int, metric: str, score: float, base_score: float):
-        self.scores[str(da_id)]["da"] = da_id
-        self._add_score(
-            score_type="bin",
-            da=da_id,
-            metric=metric,
-            score=(1 if score > base_score else 0),
-        )
+    """
+    The scores of a set of DAs, held as one array per metric of the budget's increases
+    and one of the baseline, both aligned with the DA ids. Arrays are preallocated for
+    the DAs passed in and grow for any others that are added.
+    """
 
-        self._add_score(
-            score_type="budget",
-            da=da_id,
-            metric=metric,
-            score=(score + base_score),
-        )
+    __slots__ = ("_da_ids", "_positions", "_size", "_increase", "_original")
+
+    def __init__(self, da_ids: Iterable[int] = ()):
+        da_ids = list(da_ids)
+        self._da_ids = np.zeros(max(len(da_ids), 16), dtype=np.int64)
+        self._da_ids[: len(da_ids)] = da_ids
+        self._positions = {da_id: i for i, da_id in enumerate(da_ids)}
+        self._size = len(da_ids)
+        self._increase: Dict[str, np.ndarray] = {}
+        self._original: Dict[str, np.ndarray] = {}
+
+    def _position(self, da_id: int):
+        position = self._positions.get(da_id)
+        if position is None:
+            if self._size == len(self._da_ids):
+                self._grow(2 * self._size)
+            position = self._positions[da_id] = self._size
+            self._da_ids[position] = da_id
+            self._size += 1
+        return position
+
+    def _grow(self, capacity: int):
+        def grown(values: np.ndarray, fill):
+            new = np.full(capacity, fill, dtype=values.dtype)
+            new[: len(values)] = values
+            return new
+
+        self._da_ids = grown(self._da_ids, 0)
+        for arrays in (self._increase, self._original):
+            for metric, values in arrays.items():
+                arrays[metric] = grown(values, np.nan)
+
+    def _metric_arrays(self, metric: str):
+        if metric not in self._increase:
+            self._increase[metric] = np.full(len(self._da_ids), np.nan)
+            self._original[metric] = np.full(len(self._da_ids), np.nan)
+        return self._increase[metric], self._original[metric]
 
-        self._add_score(
-            score_type="diff",
-            da=da_id,
-            metric=metric,
-            score=int(score),
+    def add_da_metric(self, da_id: int, metric: str, score: float, base_score: float):
+        position = self._position(da_id)
+        increase, original = self._metric_arrays(metric)
+        increase[position] = score
+        original[position] = base_score
+
+    def add_metric_vector(
+        self,
+        metric: str,
+        da_ids: Sequence[int],
+        scores: Sequence[float] | np.ndarray,
+        base_scores: Sequence[float] | np.ndarray,
+    ):
+        """
+        Add a metric's scores for many DAs at once
+
+            Args
+                metric (`str`): the metric
+                da_ids (`Sequence[int]`): the DAs
+                scores (`Sequence[float] | np.ndarray`): the increase of each DA's score
+                base_scores (`Sequence[float] | np.ndarray`): each DA's baseline score
+        """
+        # positions first, adding DAs can reallocate the arrays
+        positions = np.fromiter(
+            (self._position(da_id) for da_id in da_ids),
+            dtype=np.int64,
+            count=len(da_ids),
         )
-
-        self._add_score(
-            score_type="original",
-            da=da_id,
-            metric=metric,
-            score=(base_score),
+        increase, original = self._metric_arrays(metric)
+        increase[positions] = scores
+        original[positions] = base_scores
+
+    def to_columns(self) -> ScoreColumns:
+        """The derived scores of every DA that has any, ordered by DA id"""
+        order = np.argsort(self._da_ids[: self._size], kind="stable")
+        metrics = sorted(self._increase.keys())
+
+        def stacked(arrays: Dict[str, np.ndarray]):
+            return np.array(
+                [arrays[metric][: self._size][order] for metric in metrics]
+            ).reshape(len(metrics), self._size)
+
+        increase, original = stacked(self._increase), stacked(self._original)
+        present = ~np.isnan(increase) & ~np.isnan(original)
+        keep = present.any(axis=0)
+
+        with np.errstate(invalid="ignore"):
+            derived = {
+                "budget": increase + original,
+                "original": original,
+                "diff": np.trunc(increase),
+                "bin": (increase > original).astype(np.float64),
+            }
+
+        return ScoreColumns(
+            da_ids=self._da_ids[: self._size][order][keep],
+            metrics=metrics,
+            scores={
+                score_type: np.where(present, values, np.nan)[:, keep]
+                for score_type, values in derived.items()
+            },
         )
 
-    def _add_score(self, score_type: str, da: int, score: float, metric: str):
-        self.scores[str(da)]["scores"][score_type][metric] = score
-
     def to_dict(self):
-        return dict(self.scores)
+        return self.to_columns().to_dict()
@@ -0,0 +1,28 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from api.models import DataVersion
+
+# the stamp lives in a single row
+DATA_VERSION_ID = 1
+
+
+def bump_data_version(session: Session):
+    """
+    Increment the data version, creating it if this is the first import,
+    so that every response derived from the old data is invalidated
+
+        Args
+            session (`Session`): the database session
+    """
+    stmt = insert(DataVersion).values(
+        id=DATA_VERSION_ID, version=1, updated_at=func.now()
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DataVersion.id],
+            set_={"version": DataVersion.version + 1, "updated_at": func.now()},
+        )
+    )
+    session.commit()
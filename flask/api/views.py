@@ -0,0 +1,99 @@
+# Materialized views over data that only changes at import time, so routes read one
+# precomputed row per key instead of aggregating the underlying rows per request.
+# `db.create_all` and `db.drop_all` create and drop them along with the tables, and the
+# import scripts refresh them through `refresh_materialized_views`.
+
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import Integer, column, event, func, select, table, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, aggregate_order_by
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from api.models import BudgetProjectMember, BudgetScore, Metric, db
+
+
+@dataclass(frozen=True)
+class MaterializedView:
+    name: str
+    query: Select
+    # unique per row, which `REFRESH ... CONCURRENTLY` requires an index on
+    key: str
+
+    def create_sql(self):
+        query = self.query.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        return [
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {self.name} AS {query}",
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{self.name}_{self.key} ON {self.name} ({self.key})",
+        ]
+
+
+# {dissemination_area_id: {metric: score}} of the existing network
+baseline_score_pivot = table(
+    "baseline_score_pivot",
+    column("dissemination_area_id", Integer),
+    column("scores", JSONB),
+)
+
+# the projects each arterial is part of through a budget, one entry per membership
+arterial_project_ids = table(
+    "arterial_project_ids",
+    column("arterial_id", Integer),
+    column("project_ids", ARRAY(Integer)),
+)
+
+MATERIALIZED_VIEWS: List[MaterializedView] = [
+    MaterializedView(
+        name=baseline_score_pivot.name,
+        query=select(
+            BudgetScore.dissemination_area_id,
+            func.jsonb_object_agg(Metric.name, BudgetScore.score).label("scores"),
+        )
+        .join(Metric, Metric.id == BudgetScore.metric_id)
+        .filter(BudgetScore.budget_id == None)
+        .group_by(BudgetScore.dissemination_area_id),
+        key="dissemination_area_id",
+    ),
+    MaterializedView(
+        name=arterial_project_ids.name,
+        query=select(
+            BudgetProjectMember.arterial_id,
+            func.array_agg(
+                aggregate_order_by(
+                    BudgetProjectMember.project_id, BudgetProjectMember.project_id
+                )
+            ).label("project_ids"),
+        ).group_by(BudgetProjectMember.arterial_id),
+        key="arterial_id",
+    ),
+]
+
+
+@event.listens_for(db.metadata, "after_create")
+def create_materialized_views(target, connection, **kw):
+    for view in MATERIALIZED_VIEWS:
+        for statement in view.create_sql():
+            connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, "before_drop")
+def drop_materialized_views(target, connection, **kw):
+    for view in MATERIALIZED_VIEWS:
+        connection.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {view.name}"))
+
+
+def refresh_materialized_views(session: Session):
+    """
+    Recompute every materialized view, run after an import changes their tables.
+    Refreshing concurrently lets the routes keep reading the old rows meanwhile.
+
+        Args
+            session (`Session`): the database session
+    """
+    for view in MATERIALIZED_VIEWS:
+        session.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view.name}"))
+    session.commit()
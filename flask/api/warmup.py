@@ -0,0 +1,61 @@
+import logging
+from time import perf_counter
+from typing import List, Tuple
+
+from flask import Flask
+
+from api.app import default_cache
+from api.models import db
+from api.queries import fetch_budgets
+
+logger = logging.getLogger(__name__)
+
+# the layers and all-budget routes are only rendered here if no artifact has been built for them
+STATIC_PATHS = [
+    "/default-scores",
+    "/budgets/scores?ids=all",
+    "/budgets/arterials?ids=all",
+    "/budgets/summary",
+    "/arterials",
+    "/existing-lanes",
+    "/das",
+    "/das?format=topojson",
+    "/intersections",
+]
+
+
+def warm_cache(app: Flask) -> List[Tuple[str, int, float]]:
+    """
+    Request every cached route once, including those of each budget, so the shared
+    cache is full before the workers take traffic
+
+        Args
+            app (`Flask`): the app, its cache should be the one the workers use
+
+        Returns
+            `List[Tuple[str, int, float]]`, the path, status and seconds taken of each request
+    """
+    with app.app_context():
+        # re-read the data version so a fresh import invalidates what's there first
+        default_cache.delete("data-version")
+        budget_ids = [budget.id for budget in fetch_budgets(db.session)]
+
+    paths = STATIC_PATHS + [
+        path
+        for id in budget_ids
+        for path in (f"/budgets/{id}/arterials", f"/budgets/{id}/scores")
+    ]
+
+    client = app.test_client()
+    results = []
+    for path in paths:
+        start = perf_counter()
+        res = client.get(path)
+        results.append((path, res.status_code, perf_counter() - start))
+        logger.info(f"warmed {path} ({res.status_code})")
+
+    with app.app_context():
+        # don't hand open connections to forked workers
+        db.engine.dispose()
+
+    return results
@@ -0,0 +1,55 @@
+# gunicorn picks this up from the working directory
+
+import gc
+
+# load the app in the master, so what it loads ahead of the first request (see
+# `api.app.preload`) is shared by the workers copy-on-write rather than loaded by each
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Runs in the master once it's listening but before any worker is started,
+    so the workers come up to a full cache and a loaded accessibility context
+    """
+    from api.app import preload
+    from api.warmup import warm_cache
+
+    app = server.app.wsgi()
+
+    # the collector would free objects the warmup leaves behind, leaving holes in pages
+    # the workers would otherwise share
+    gc.disable()
+
+    try:
+        results = warm_cache(app)
+    except Exception:
+        # a cold cache is better than no server
+        server.log.exception("cache warmup failed")
+    else:
+        elapsed = sum(seconds for _, _, seconds in results)
+        server.log.info(f"warmed {len(results)} routes in {elapsed:.1f}s")
+
+    try:
+        preload(app)
+    except Exception:
+        server.log.exception("accessibility preload failed")
+
+    # keep the collector of each worker from writing to the objects loaded so far,
+    # which would copy their pages into it
+    gc.freeze()
+    gc.enable()
+
+
+def post_fork(server, worker):
+    """
+    Start the worker's job pool as it comes up, so the pool's processes have loaded the
+    engine by the first job
+    """
+    from api.app import accessibility_jobs
+
+    try:
+        accessibility_jobs.start()
+    except Exception:
+        # the pool is started on the first job instead
+        server.log.exception("accessibility pool start failed")
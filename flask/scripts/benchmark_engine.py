@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+
+# Measure what loading the accessibility engine in the gunicorn master (see
+# `api.engine.load_engine`) buys the workers. Workers are forked the way gunicorn forks
+# them, first from a master that hasn't run the engine, then from one that has, and each
+# times its first and second computation and reports its memory: RSS, and the private
+# part of it, which is what each worker costs on top of what it shares with the master.
+
+import gc
+import json
+import os
+from time import perf_counter
+from typing import Dict, List
+
+from api.accessibility import ACCESSIBILITY_METRICS
+from api.engine import calculate_accessibility, load_engine
+
+
+def memory() -> Dict[str, float]:
+    """This process's resident memory in MB, from /proc (so Linux only)"""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def worker(project_sets: List[List[int]]) -> Dict[str, float]:
+    timings = []
+    for project_ids in project_sets:
+        start = perf_counter()
+        calculate_accessibility(project_ids, ACCESSIBILITY_METRICS)
+        timings.append(perf_counter() - start)
+    return {"first": timings[0], "second": timings[1], **memory()}
+
+
+def fork_workers(workers: int, project_sets: List[List[int]]) -> List[Dict[str, float]]:
+    pipes = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        if os.fork() == 0:
+            os.close(read)
+            with os.fdopen(write, "w") as f:
+                json.dump(worker(project_sets), f)
+            os._exit(0)
+        os.close(write)
+        pipes.append(read)
+
+    results = []
+    for read in pipes:
+        with os.fdopen(read) as f:
+            results.append(json.load(f))
+    for _ in pipes:
+        os.wait()
+    return results
+
+
+def benchmark(workers: int, project_sets: List[List[int]]):
+    print(
+        f"{'master':>10}{'worker':>8}{'first s':>10}{'second s':>10}{'rss MB':>10}{'private MB':>12}"
+    )
+
+    def report(master: str, results: List[Dict[str, float]]):
+        for i, result in enumerate(results):
+            print(
+                f"{master:>10}{i:>8}{result['first']:>10.2f}{result['second']:>10.2f}"
+                f"{result['rss']:>10.1f}{result['private']:>12.1f}"
+            )
+
+    report("cold", fork_workers(workers, project_sets))
+
+    start = perf_counter()
+    load_engine()
+    # as gunicorn.conf.py does, so the workers' collectors leave the shared pages alone
+    gc.freeze()
+    print(
+        f"engine load: {perf_counter() - start:.2f}s, master {memory()['rss']:.1f} MB"
+    )
+
+    report("preloaded", fork_workers(workers, project_sets))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Benchmark engine",
+        description="Compare workers forked before and after loading the accessibility engine.",
+    )
+
+    parser.add_argument("--workers", type=int, default=2)
+    # two different sets, so the second computation isn't helped by anything the
+    # engine might keep of the first's results
+    parser.add_argument("--first", type=int, nargs="+", default=[0])
+    parser.add_argument("--second", type=int, nargs="+", default=[1])
+
+    args = parser.parse_args()
+
+    benchmark(args.workers, [args.first, args.second])
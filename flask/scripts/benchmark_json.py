@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+
+# Compare the time flask's default JSON provider and `OrjsonProvider` take to encode
+# the payloads of the routes that are serialized in python. Payloads are built once up
+# front, so only encoding is timed. Bodies postgres renders (layers, json budget scores)
+# are sent as-is and aren't included.
+
+from statistics import median
+from time import perf_counter
+from typing import Any, Dict
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import orjson
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from api.json_provider import OrjsonProvider
+from api.layers import LAYERS
+from api.queries import (
+    fetch_budget_ids,
+    fetch_budget_members,
+    fetch_budgets,
+    fetch_budgets_members,
+    fetch_metrics,
+    group_members_by_budget,
+)
+from api.scores import changed_das, load_score_cube, summarize
+from api.settings import app_settings
+from api.topojson import render_topology
+
+
+def route_payloads(session: Session, budget_id: int) -> Dict[str, Any]:
+    cube = load_score_cube(session)
+    columns = cube.budget_columns(budget_id)
+    topology = render_topology(session, LAYERS["das"])
+
+    return {
+        "/budgets": [row._asdict() for row in fetch_budgets(session)],
+        "/metrics": [row._asdict() for row in fetch_metrics(session)],
+        "/budgets/<id>/arterials": [
+            row._asdict() for row in fetch_budget_members(session, budget_id)
+        ],
+        "/budgets/arterials?ids=all": group_members_by_budget(
+            fetch_budgets_members(session), fetch_budget_ids(session)
+        ),
+        "/default-scores": cube.baseline_dict(),
+        "/default-scores?format=columnar": cube.baseline_columns().to_columnar(),
+        "/budgets/<id>/scores?format=columnar": columns.to_columnar(),
+        "/budgets/<id>/scores?sparse=true": {
+            "scores": changed_das(columns).to_dict(),
+            "summary": summarize(columns),
+        },
+        # the accessibility route's json body has the same shape as a budget's scores
+        "/accessibility": columns.to_dict(),
+        "/das?format=topojson": orjson.loads(topology),
+    }
+
+
+def benchmark(budget_id: int, runs: int, precision: int | None):
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+    app = Flask(__name__)
+
+    default = DefaultJSONProvider(app)
+    default.compact = True
+    fast = OrjsonProvider(app)
+    fast.float_precision = precision
+
+    providers = {"default": default.dumps, "orjson": fast.dumps_bytes}
+
+    with Session(engine) as session:
+        payloads = route_payloads(session, budget_id)
+
+    print(f"{'route':<40}{'provider':<10}{'KB':>10}{'median ms':>12}")
+
+    for route, payload in payloads.items():
+        for name, dumps in providers.items():
+            timings = []
+            for _ in range(runs):
+                start = perf_counter()
+                body = dumps(payload)
+                timings.append(perf_counter() - start)
+
+            print(
+                f"{route:<40}{name:<10}{len(body) / 1024:>10.1f}{median(timings) * 1000:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Benchmark JSON",
+        description="Compare encode times of the default and orjson JSON providers.",
+    )
+
+    parser.add_argument("--budget-id", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=app_settings.JSON_FLOAT_PRECISION,
+        help="decimals the orjson provider rounds floats to",
+    )
+
+    args = parser.parse_args()
+
+    benchmark(args.budget_id, args.runs, args.precision)
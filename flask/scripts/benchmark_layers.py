@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+# Compare the legacy shapely/geojson rendering of the map layers with the PostGIS rendering.
+# Every measurement runs in a fresh process, so latency is cold-cache and peak RSS belongs
+# to a single rendering path.
+
+from multiprocessing import get_context
+import resource
+from statistics import median
+from time import perf_counter
+
+import geojson
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from api.layers import LAYERS, feature_collection_query
+from api.settings import app_settings
+from api.utils import properties_to_geojson_features
+
+
+def render_legacy(name: str, session: Session):
+    layer = LAYERS[name]
+    columns = [expr.label(key) for key, expr in layer.properties.items()]
+    rows = session.execute(select(*columns, layer.model.geometry)).mappings().all()
+    data = properties_to_geojson_features([dict(row) for row in rows])
+    return geojson.dumps(data)
+
+
+def render_postgis(name: str, session: Session):
+    return session.execute(feature_collection_query(LAYERS[name])).scalar()
+
+
+RENDERERS = {"legacy": render_legacy, "postgis": render_postgis}
+
+
+def measure(renderer: str, name: str):
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+    with Session(engine) as session:
+        # open the connection first so we only time the rendering
+        session.connection()
+        # ru_maxrss is reported in kilobytes on linux
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = perf_counter()
+        body = RENDERERS[renderer](name, session)
+        elapsed = perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, len(body), rss_after, rss_after - rss_before
+
+
+def benchmark(layers: list[str], runs: int):
+    ctx = get_context("spawn")
+    print(
+        f"{'layer':<16}{'renderer':<10}{'median s':>10}{'bytes':>12}{'peak RSS MB':>14}{'growth MB':>12}"
+    )
+    for name in layers:
+        for renderer in RENDERERS:
+            results = []
+            for _ in range(runs):
+                with ctx.Pool(1) as pool:
+                    results.append(pool.apply(measure, (renderer, name)))
+            elapsed = median(r[0] for r in results)
+            size = results[0][1]
+            peak = max(r[2] for r in results) / 1024
+            growth = max(r[3] for r in results) / 1024
+            print(
+                f"{name:<16}{renderer:<10}{elapsed:>10.3f}{size:>12}{peak:>14.1f}{growth:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Benchmark layers",
+        description="Compare cold-cache latency and peak RSS of the layer renderers.",
+    )
+
+    parser.add_argument(
+        "--layers", nargs="+", choices=list(LAYERS.keys()), default=list(LAYERS.keys())
+    )
+    parser.add_argument("--runs", type=int, default=3)
+
+    args = parser.parse_args()
+
+    benchmark(args.layers, args.runs)
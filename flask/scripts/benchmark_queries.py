@@ -0,0 +1,264 @@
+#! /usr/bin/env python
+
+# Compare the ORM entity loads the read routes used to make with the Core selects in
+# `api.queries`. Every statement a fetch executes is captured and re-run wrapped in a
+# count/size query, so the report shows rows and bytes read from postgres per route
+# alongside the median latency of the fetch itself.
+
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, NamedTuple
+
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import Session, joinedload
+
+from api.models import (
+    Budget,
+    BudgetProjectMember,
+    BudgetScore,
+    DisseminationArea,
+    Metric,
+)
+from api.queries import (
+    fetch_budget_members,
+    fetch_budgets,
+    fetch_da_origin_map,
+    fetch_metrics,
+)
+from api.settings import app_settings
+
+# the score routes now have postgres render their payloads (see `api.scores`), these
+# are the row-level Core fetches they made before that, kept to compare against
+
+
+class ScoreRow(NamedTuple):
+    dissemination_area_id: int
+    metric: str
+    score: float
+
+
+def _score_query():
+    return select(
+        BudgetScore.dissemination_area_id, Metric.name, BudgetScore.score
+    ).join(Metric, Metric.id == BudgetScore.metric_id)
+
+
+def fetch_baseline_scores(
+    session: Session, da_ids: Iterable[int] | None = None
+) -> List[ScoreRow]:
+    """
+    Fetch the scores of the existing network, optionally limited to some DAs
+
+        Args
+            session (`Session`): the database session
+            da_ids (`Iterable[int] | None`): the DAs to fetch, defaults to all of them
+
+        Returns
+            `List[ScoreRow]`
+    """
+    query = _score_query().filter(BudgetScore.budget_id == None)
+    if da_ids is not None:
+        query = query.filter(BudgetScore.dissemination_area_id.in_(list(da_ids)))
+    return [ScoreRow._make(row) for row in session.execute(query)]
+
+
+def fetch_budget_scores(session: Session, budget_id: int) -> List[ScoreRow]:
+    return [
+        ScoreRow._make(row)
+        for row in session.execute(
+            _score_query().filter(BudgetScore.budget_id == budget_id)
+        )
+    ]
+
+
+def baseline_score_map(rows: Iterable[ScoreRow]) -> Dict[int, Dict[str, float]]:
+    """Pivot score rows to {da_id: {metric: score}}"""
+    scores: Dict[int, Dict[str, float]] = {}
+    for da_id, metric, score in rows:
+        scores.setdefault(da_id, {})[metric] = score
+    return scores
+
+
+def legacy_budgets(session: Session, budget_id: int):
+    return session.execute(select(Budget)).scalars().all()
+
+
+def legacy_metrics(session: Session, budget_id: int):
+    return session.execute(select(Metric)).scalars().all()
+
+
+def legacy_budget_arterials(session: Session, budget_id: int):
+    return (
+        session.execute(
+            select(BudgetProjectMember).filter(
+                BudgetProjectMember.budget_id == budget_id
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+
+def legacy_default_scores(session: Session, budget_id: int):
+    return (
+        session.execute(
+            select(BudgetScore)
+            .options(joinedload(BudgetScore.dissemination_area))
+            .options(joinedload(BudgetScore.metric))
+            .filter(BudgetScore.budget == None)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def legacy_budget_scores(session: Session, budget_id: int):
+    budget = session.execute(
+        select(Budget)
+        .options(joinedload(Budget.scores).subqueryload(BudgetScore.dissemination_area))
+        .filter(Budget.id == budget_id)
+    ).scalar()
+
+    return (
+        session.execute(
+            select(BudgetScore)
+            .options(joinedload(BudgetScore.dissemination_area))
+            .options(joinedload(BudgetScore.metric))
+            .filter(BudgetScore.budget == None)
+            .filter(
+                BudgetScore.dissemination_area_id.in_(
+                    [s.dissemination_area_id for s in budget.scores]
+                )
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+
+def legacy_accessibility(session: Session, budget_id: int):
+    da_map = {
+        da.origin_id: da.id
+        for da in session.execute(select(DisseminationArea)).scalars().all()
+    }
+    defaults = legacy_default_scores(session, budget_id)
+    return da_map, defaults
+
+
+def core_budget_scores(session: Session, budget_id: int):
+    scores = fetch_budget_scores(session, budget_id)
+    return baseline_score_map(
+        fetch_baseline_scores(session, {s.dissemination_area_id for s in scores})
+    )
+
+
+def core_accessibility(session: Session, budget_id: int):
+    return fetch_da_origin_map(session), baseline_score_map(
+        fetch_baseline_scores(session)
+    )
+
+
+Fetch = Callable[[Session, int], object]
+
+ROUTES: Dict[str, Dict[str, Fetch]] = {
+    "/budgets": {
+        "orm": legacy_budgets,
+        "core": lambda session, _: fetch_budgets(session),
+    },
+    "/metrics": {
+        "orm": legacy_metrics,
+        "core": lambda session, _: fetch_metrics(session),
+    },
+    "/budgets/<id>/arterials": {
+        "orm": legacy_budget_arterials,
+        "core": fetch_budget_members,
+    },
+    "/default-scores": {
+        "orm": legacy_default_scores,
+        "core": lambda session, _: fetch_baseline_scores(session),
+    },
+    "/budgets/<id>/scores": {
+        "orm": legacy_budget_scores,
+        "core": core_budget_scores,
+    },
+    "/accessibility": {
+        "orm": legacy_accessibility,
+        "core": core_accessibility,
+    },
+}
+
+
+def capture_statements(session: Session, fetch: Fetch, budget_id: int):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fetch(session, budget_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        session.expunge_all()
+
+    return statements
+
+
+def transferred(session: Session, statements: List[tuple]):
+    """Sum the rows and on-disk bytes of the rows the statements return"""
+    rows, size = 0, 0
+    cursor = session.connection().connection.cursor()
+    for statement, parameters in statements:
+        cursor.execute(
+            f"SELECT count(*), coalesce(sum(pg_column_size(t.*)), 0) FROM ({statement}) t",
+            parameters,
+        )
+        count, total = cursor.fetchone()
+        rows += count
+        size += total
+    cursor.close()
+    return rows, size
+
+
+def benchmark(budget_id: int, runs: int):
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+
+    print(
+        f"{'route':<26}{'loader':<8}{'queries':>9}{'rows':>10}{'KB':>12}{'median ms':>12}"
+    )
+
+    with Session(engine) as session:
+        session.execute(text("SELECT 1"))
+        for route, loaders in ROUTES.items():
+            for loader, fetch in loaders.items():
+                statements = capture_statements(session, fetch, budget_id)
+                rows, size = transferred(session, statements)
+
+                timings = []
+                for _ in range(runs):
+                    start = perf_counter()
+                    fetch(session, budget_id)
+                    timings.append(perf_counter() - start)
+                    # don't let the identity map serve later runs
+                    session.expunge_all()
+
+                print(
+                    f"{route:<26}{loader:<8}{len(statements):>9}{rows:>10}{size / 1024:>12.1f}{median(timings) * 1000:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Benchmark queries",
+        description="Compare rows, bytes and latency of the ORM and Core read paths.",
+    )
+
+    parser.add_argument("--budget-id", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=5)
+
+    args = parser.parse_args()
+
+    benchmark(args.budget_id, args.runs)
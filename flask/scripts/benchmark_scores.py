@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+
+# Compare serving budget scores through the ORM, as get_project_scores used to, with
+# slicing the in-memory score cube and with having postgres build the payload in one
+# statement. The cube's one-off load time is reported separately, since it is paid once
+# per data version rather than per request.
+
+import json
+from statistics import median
+from time import perf_counter
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, joinedload
+
+from api.models import Budget, BudgetScore
+from api.scores import ScoreCube, budget_scores_query, load_score_cube
+from api.settings import app_settings
+from api.utils import DaScoreResult
+
+
+def orm_budget_scores(session: Session, budget_id: int):
+    budget = session.execute(
+        select(Budget)
+        .options(joinedload(Budget.scores).subqueryload(BudgetScore.dissemination_area))
+        .filter(Budget.id == budget_id)
+    ).scalar()
+
+    defaults = (
+        session.execute(
+            select(BudgetScore)
+            .options(joinedload(BudgetScore.dissemination_area))
+            .options(joinedload(BudgetScore.metric))
+            .filter(BudgetScore.budget == None)
+            .filter(
+                BudgetScore.dissemination_area_id.in_(
+                    [s.dissemination_area_id for s in budget.scores]
+                )
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+    default_dict = {}
+    for d in defaults:
+        default_dict.setdefault(d.dissemination_area_id, {})[d.metric.name] = d.score
+
+    scores = DaScoreResult()
+    for score in budget.scores:
+        scores.add_da_metric(
+            da_id=score.dissemination_area_id,
+            metric=score.metric.name,
+            base_score=default_dict[score.dissemination_area_id][score.metric.name],
+            score=score.score,
+        )
+
+    return scores.to_dict()
+
+
+def cube_budget_scores(cube: ScoreCube, budget_id: int):
+    return cube.budget_dict(budget_id)
+
+
+def sql_budget_scores(session: Session, budget_id: int):
+    return session.execute(budget_scores_query(budget_id)).scalar()
+
+
+def benchmark(runs: int):
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+
+    with Session(engine) as session:
+        start = perf_counter()
+        cube = load_score_cube(session)
+        print(
+            f"cube load: {perf_counter() - start:.3f}s, "
+            f"{cube.values.nbytes / 1024 / 1024:.1f} MB, shape {cube.values.shape}"
+        )
+
+        print(f"{'budget':>8}{'orm ms':>12}{'cube ms':>12}{'sql ms':>12}{'equal':>8}")
+
+        for budget_id in cube.budget_ids[1:]:
+            orm_timings, cube_timings, sql_timings = [], [], []
+            for _ in range(runs):
+                start = perf_counter()
+                orm_result = orm_budget_scores(session, budget_id)
+                orm_timings.append(perf_counter() - start)
+                session.expunge_all()
+
+                start = perf_counter()
+                cube_result = cube_budget_scores(cube, budget_id)
+                cube_timings.append(perf_counter() - start)
+
+                start = perf_counter()
+                sql_result = sql_budget_scores(session, budget_id)
+                sql_timings.append(perf_counter() - start)
+
+            # the sql payload is compared as parsed json, e.g. it writes 13.0 as 13
+            equal = orm_result == cube_result == json.loads(sql_result)
+            orm_ms, cube_ms, sql_ms = (
+                median(timings) * 1000
+                for timings in (orm_timings, cube_timings, sql_timings)
+            )
+            print(
+                f"{budget_id:>8}{orm_ms:>12.1f}{cube_ms:>12.1f}{sql_ms:>12.1f}{str(equal):>8}"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Benchmark scores",
+        description="Compare the ORM and score cube paths for budget scores.",
+    )
+
+    parser.add_argument("--runs", type=int, default=5)
+
+    args = parser.parse_args()
+
+    benchmark(args.runs)
@@ -0,0 +1,33 @@
+#! /usr/bin/env python
+
+# Run after the import scripts: renders the static layers and the all-budgets payloads
+# and writes their pre-compressed bodies for the routes to serve as-is
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from api.artifacts import build_artifacts
+from api.layers import LAYERS
+from api.settings import app_settings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Build artifacts",
+        description="Pre-render and compress the map layers.",
+    )
+
+    parser.add_argument("--artifact_dir", default=app_settings.ARTIFACT_DIR)
+    parser.add_argument("--layers", nargs="+", choices=list(LAYERS.keys()))
+
+    args = parser.parse_args()
+
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+
+    with Session(engine) as session:
+        print("building layer artifacts...")
+        manifest = build_artifacts(session, args.artifact_dir, args.layers)
+        for name, entry in manifest.items():
+            print(f"{name}: {entry['sizes']}")
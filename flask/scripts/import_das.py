@@ -12,6 +12,7 @@ from sqlalchemy.orm import Session
 
 from api.models import DisseminationArea
 from api.settings import app_settings
+from api.versioning import bump_data_version
 from api.utils import extract_files
 
 
@@ -63,3 +64,4 @@ if __name__ == "__main__":
     with Session(engine) as session:
         print("importing DAs...")
         import_das(args.archive_path, session)
+        bump_data_version(session)
@@ -10,6 +10,7 @@ from sqlalchemy.dialects.postgresql import insert
 
 from api.models import ExistingLane
 from api.settings import app_settings
+from api.versioning import bump_data_version
 
 
 def import_geojson(geojson_path: str, session: Session):
@@ -45,3 +46,4 @@ if __name__ == "__main__":
 
     with Session(engine) as session:
         import_geojson(args.geojson_path, session)
+        bump_data_version(session)
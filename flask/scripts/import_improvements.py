@@ -12,6 +12,9 @@ from sqlalchemy.dialects.postgresql import insert
 
 from api.models import Arterial, Budget, BudgetProjectMember
 from api.settings import app_settings
+from api.summaries import build_budget_summaries
+from api.versioning import bump_data_version
+from api.views import refresh_materialized_views
 
 
 def import_rows(mapping_path: str, csv_path: str, session: Session):
@@ -89,3 +92,6 @@ if __name__ == "__main__":
 
     with Session(engine) as session:
         import_improvements(args.mapping_path, args.csv_path, session)
+        refresh_materialized_views(session)
+        build_budget_summaries(session)
+        bump_data_version(session)
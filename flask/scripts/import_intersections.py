@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 
 from api.models import Intersection
 from api.settings import app_settings
+from api.versioning import bump_data_version
 from api.utils import extract_files
 
 
@@ -68,3 +69,4 @@ if __name__ == "__main__":
         import_intersections(
             args.intersection_geojson_path, args.unsignaled_ids_path, session
         )
+        bump_data_version(session)
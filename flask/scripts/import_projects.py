@@ -12,6 +12,7 @@ from sqlalchemy.orm import Session
 
 from api.models import Arterial, Project
 from api.settings import app_settings
+from api.versioning import bump_data_version
 from api.utils import extract_files
 
 
@@ -107,3 +108,4 @@ if __name__ == "__main__":
     with Session(engine) as session:
         print("importing projects and arterials....")
         import_projects(args.archive_path, args.mapping_path, session)
+        bump_data_version(session)
@@ -8,6 +8,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
 
 from api.settings import app_settings
+from api.summaries import build_budget_summaries
+from api.versioning import bump_data_version
+from api.views import refresh_materialized_views
 from api.models import Budget, BudgetScore, Metric, DisseminationArea
 
 
@@ -41,6 +44,9 @@ def extract_scores(
         )
         for budget, budget_id in budgets.items():
             score = baseline_score = float(row[f"{metric}_increase_{budget}"] or 0)
+            # a missing increase is read as zero, so there's no need to store it
+            if score == 0:
+                continue
             ret.append(
                 {
                     "metric_id": metric_id,
@@ -122,3 +128,6 @@ if __name__ == "__main__":
     with Session(engine) as session:
         print("importing Scores...")
         import_scores(args.csv_path, session)
+        refresh_materialized_views(session)
+        build_budget_summaries(session)
+        bump_data_version(session)
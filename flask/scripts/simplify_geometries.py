@@ -0,0 +1,35 @@
+#! /usr/bin/env python
+
+# Run after the DAs and existing lanes are imported: precomputes the simplified
+# geometries the layer routes serve at overview zoom levels
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from api.layers import LAYERS, build_simplified_geometries
+from api.settings import app_settings
+from api.versioning import bump_data_version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Simplify geometries",
+        description="Precompute simplified geometry tiers for the map layers.",
+    )
+
+    parser.add_argument(
+        "--layers",
+        nargs="+",
+        choices=[name for name, layer in LAYERS.items() if layer.simplify],
+    )
+
+    args = parser.parse_args()
+
+    engine = create_engine(app_settings.POSTGRES_CONNECTION_STRING)
+
+    with Session(engine) as session:
+        print("simplifying geometries...")
+        build_simplified_geometries(session, args.layers)
+        bump_data_version(session)
@@ -0,0 +1,20 @@
+#! /usr/bin/env python
+
+# Run after an import (or any time) to refill the shared response cache
+
+from api.app import create_app
+from api.warmup import warm_cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Warm cache",
+        description="Request every cached route once to fill the shared cache.",
+    )
+
+    parser.parse_args()
+
+    for path, status, elapsed in warm_cache(create_app()):
+        print(f"{path:<32}{status:>5}{elapsed:>10.3f}s")
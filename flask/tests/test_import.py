@@ -159,6 +159,28 @@ def test_import_scores(app_ctx, fresh_db, tmp_path):
     assert len(scores) == 10
 
 
+def test_import_scores_skips_zero_increases(app_ctx, fresh_db):
+    das = dissemination_area_factory(fresh_db.session).create_batch(4)
+    budget = budget_model_factory(fresh_db.session).create(name="50")
+    rows = [
+        {
+            "origin": i,
+            "foo_original": 4,
+            "origin_DA_id": da.DAUID,
+            f"foo_increase_{budget.name}": i % 2,
+        }
+        for i, da in enumerate(das)
+    ]
+
+    _import_scores(rows, fresh_db.session)
+
+    scores = fresh_db.session.execute(select(BudgetScore)).scalars().all()
+
+    # 4 originals, and an increase for the 2 DAs that have one
+    assert len(scores) == 6
+    assert len([s for s in scores if s.budget_id is not None]) == 2
+
+
 def test_import_intersection(fresh_db):
     intersection_ids = [13464408, 13464459, 13464494]
     feature = geojson.Feature(
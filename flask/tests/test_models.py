@@ -1,5 +1,14 @@
+from sqlalchemy import event, select, text
+from sqlalchemy.dialects import postgresql
+
 from tests.factories import budget_model_factory, dissemination_area_factory
-from api.models import Metric, BudgetScore
+from api.models import DataVersion, Metric, BudgetScore
+from api.versioning import bump_data_version
+from api.views import (
+    MATERIALIZED_VIEWS,
+    baseline_score_pivot,
+    refresh_materialized_views,
+)
 
 
 def test_score_relationships(fresh_db):
@@ -8,3 +17,125 @@ def test_score_relationships(fresh_db):
     metric = Metric(name="employment")
     score = BudgetScore(metric=metric, dissemination_area=da, budget=budget, score=1.2)
     assert score.metric.id == metric.id
+
+
+def test_bump_data_version(fresh_db):
+    bump_data_version(fresh_db.session)
+    first = fresh_db.session.get(DataVersion, 1)
+    assert first.version == 1
+    bump_data_version(fresh_db.session)
+    fresh_db.session.refresh(first)
+    assert first.version == 2
+
+
+def test_refresh_materialized_views(fresh_db):
+    session = fresh_db.session
+    budget = budget_model_factory(session).create()
+    da = dissemination_area_factory(session).create()
+    metrics = [Metric(name="a"), Metric(name="b")]
+    for i, metric in enumerate(metrics):
+        session.add(BudgetScore(metric=metric, dissemination_area=da, score=i))
+        session.add(
+            BudgetScore(metric=metric, dissemination_area=da, budget=budget, score=5)
+        )
+    session.commit()
+
+    pivot = select(
+        baseline_score_pivot.c.dissemination_area_id, baseline_score_pivot.c.scores
+    )
+    # the views only change when refreshed
+    assert session.execute(pivot).all() == []
+
+    refresh_materialized_views(session)
+    assert session.execute(pivot).all() == [(da.id, {"a": 0, "b": 1})]
+
+
+def _plan_names(plan):
+    """The indexes and the relations a plan scans"""
+    indexes, relations, nodes = set(), set(), [plan]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return indexes, relations
+
+
+def _route_plan_names(client, engine, url):
+    """The indexes and relations postgres plans to scan for the selects a request runs"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        assert client.get(url).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    indexes, relations = set(), set()
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith("SELECT"):
+                continue
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            ).scalar()[0]["Plan"]
+            plan_indexes, plan_relations = _plan_names(plan)
+            indexes |= plan_indexes
+            relations |= plan_relations
+    return indexes, relations
+
+
+def test_lookup_indexes(client, fresh_db):
+    session = fresh_db.session
+    # about the size of the real data: the city's DAs, two metrics and 20 budgets
+    # that each change a third of the DAs and take in a tenth of the arterials
+    session.execute(
+        text(
+            """
+            INSERT INTO metrics (id, name) VALUES (1, 'job'), (2, 'populations');
+            INSERT INTO budgets (id, name) SELECT b, b::text FROM generate_series(1, 20) b;
+            INSERT INTO projects (id) SELECT p FROM generate_series(0, 800) p;
+            INSERT INTO dissemination_areas (id, "DAUID", geometry)
+                SELECT d, d, ST_GeomFromText('MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)))')
+                FROM generate_series(1, 3700) d;
+            INSERT INTO arterials (id, "GEO_ID", total_length, geometry)
+                SELECT a, a, 100, ST_GeomFromText('LINESTRING(0 0, 1 1)')
+                FROM generate_series(1, 8000) a;
+            INSERT INTO budget_scores (metric_id, budget_id, dissemination_area_id, score)
+                SELECT m, NULL, d, d FROM generate_series(1, 3700) d, generate_series(1, 2) m;
+            INSERT INTO budget_scores (metric_id, budget_id, dissemination_area_id, score)
+                SELECT m, b, d, 1
+                FROM generate_series(1, 3700) d, generate_series(1, 2) m, generate_series(1, 20) b
+                WHERE (d + b) % 3 = 0;
+            INSERT INTO budget_project_members (arterial_id, budget_id, project_id)
+                SELECT a, b, a / 10
+                FROM generate_series(1, 8000) a, generate_series(1, 20) b
+                WHERE (a + b) % 10 = 0;
+            ANALYZE;
+            """
+        )
+    )
+
+    refresh_materialized_views(session)
+    engine = fresh_db.engine
+
+    # a budget's payload joins its increases to the baseline, alone or in a batch
+    for url in ["/budgets/3/scores", "/budgets/scores?ids=3,4"]:
+        indexes, _ = _route_plan_names(client, engine, url)
+        assert indexes >= {"ix_budget_scores_budget_id", "ix_budget_scores_baseline"}
+
+    indexes, _ = _route_plan_names(client, engine, "/budgets/3/arterials")
+    assert "ix_budget_project_members_budget_id" in indexes
+
+    # the baseline route reads the pivot view, whose refresh reads the baseline index
+    _, relations = _route_plan_names(client, engine, "/default-scores")
+    assert "baseline_score_pivot" in relations
+    assert "budget_scores" not in relations
+    sql = MATERIALIZED_VIEWS[0].query.compile(dialect=postgresql.dialect())
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+    assert "ix_budget_scores_baseline" in _plan_names(plan)[0]
@@ -1,4 +1,27 @@
-from api.models import Metric, BudgetScore, BudgetProjectMember
+import gzip
+import json
+
+from cachelib import SimpleCache
+from flask.json.provider import DefaultJSONProvider
+import pytest
+import shapely
+import shapely.geometry
+from sqlalchemy import event, func, select
+
+import api.app
+from api.accessibility import AccessibilityCache
+from api.artifacts import build_artifacts
+from api.layers import (
+    LAYERS,
+    build_simplified_geometries,
+    simplification_tier,
+    tolerance_for_zoom,
+)
+from api.models import Metric, BudgetScore, BudgetProjectMember, SimplifiedGeometry
+from api.summaries import build_budget_summaries
+from api.versioning import bump_data_version
+from api.views import refresh_materialized_views
+from api.warmup import warm_cache
 
 from tests.factories import (
     arterial_model_factory,
@@ -41,6 +64,8 @@ def test_get_arterials(client, fresh_db):
         session.add(bpm)
         session.commit()
 
+    refresh_materialized_views(session)
+
     # all the arterials will be in one project, and first 2 will be in a budget project too
     # will be members of another as well, through a budget
     response = client.get("/arterials")
@@ -57,6 +82,14 @@ def test_get_arterials(client, fresh_db):
         if feature["properties"]["budget_project_ids"]:
             assert len(feature["properties"]["budget_project_ids"]) == 1
             assert feature["properties"]["budget_project_ids"][0] == projects[1].id
+    assert (
+        sum(
+            1
+            for f in response_json["features"]
+            if f["properties"]["budget_project_ids"]
+        )
+        == 2
+    )
 
 
 def test_get_das(client, fresh_db):
@@ -64,6 +97,131 @@ def test_get_das(client, fresh_db):
     response = client.get("/das")
     assert response.status_code == 200
     assert len(response.json["features"]) == 10
+    assert response.json["features"][0]["geometry"]["type"] == "MultiPolygon"
+    assert set(response.json["features"][0]["properties"].keys()) == {"id", "DAUID"}
+
+
+def test_get_das_topojson(client, fresh_db):
+    dissemination_area_factory(fresh_db.session).create_batch(2)
+    response = client.get("/das?format=topojson")
+    assert response.status_code == 200
+    assert response.json["type"] == "Topology"
+    geometries = response.json["objects"]["das"]["geometries"]
+    assert len(geometries) == 2
+    assert set(geometries[0]["properties"].keys()) == {"id", "DAUID"}
+    # the factory makes identical polygons, so they share every arc
+    assert len(response.json["arcs"]) == 1
+
+
+def test_get_das_artifact(app, client, fresh_db, tmp_path):
+    dissemination_area_factory(fresh_db.session).create_batch(3)
+    build_artifacts(fresh_db.session, tmp_path, ["das"])
+    app.config["ARTIFACT_DIR"] = tmp_path
+
+    response = client.get("/das", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(response.data))["features"]) == 3
+
+    cached_response = client.get(
+        "/das",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]},
+    )
+    assert cached_response.status_code == 304
+
+    # layers that weren't built fall back to rendering
+    response = client.get("/intersections")
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+
+
+def test_get_das_streamed(app, client, fresh_db):
+    app.config["STREAM_LAYERS"] = True
+    response = client.get("/das")
+    assert response.json["features"] == []
+
+    dissemination_area_factory(fresh_db.session).create_batch(3)
+    response = client.get("/das")
+    assert len(response.json["features"]) == 3
+
+    # compression would buffer the whole body before sending any of it
+    response = client.get("/das", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.is_streamed
+    assert "Content-Encoding" not in response.headers
+    chunks = list(response.response)
+    assert len(chunks) > 1
+    assert len(json.loads(b"".join(chunks))["features"]) == 3
+
+
+def test_get_intersections_bbox(client, fresh_db):
+    intersection_model_factory(fresh_db.session).create_batch(3)
+    # the factory's point is (-79.531, 43.607)
+    response = client.get("/intersections?bbox=-79.6,43.5,-79.5,43.7")
+    assert len(response.json["features"]) == 3
+
+    response = client.get("/intersections?bbox=-79.4,43.5,-79.3,43.7")
+    assert len(response.json["features"]) == 0
+
+    response = client.get(
+        "/intersections?intersects=POLYGON((-79.6 43.5, -79.5 43.5, -79.5 43.7, -79.6 43.5))"
+    )
+    assert len(response.json["features"]) == 3
+
+    response = client.get("/intersections?bbox=-79.4,43.5,-79.5")
+    assert response.json["code"] == 422
+
+
+def _shapes_by_id(feature_collection):
+    return {
+        feature["properties"]["id"]: shapely.geometry.shape(feature["geometry"])
+        for feature in feature_collection["features"]
+    }
+
+
+def test_get_das_simplified(client, fresh_db):
+    das = dissemination_area_factory(fresh_db.session)
+    # a DA bordering two others, which meet it at a point that's nearly on its edge
+    junction = "-79.389 43.645"
+    bordered = das.create(
+        geometry=f"MULTIPOLYGON (((-79.4 43.64, -79.39 43.64, {junction}, -79.39 43.65, -79.4 43.65, -79.4003 43.6475, -79.4 43.645, -79.4003 43.6425, -79.4 43.64)))"
+    )
+    das.create(
+        geometry=f"MULTIPOLYGON (((-79.39 43.64, -79.38 43.64, -79.38 43.645, {junction}, -79.39 43.64)))"
+    )
+    das.create(
+        geometry=f"MULTIPOLYGON ((({junction}, -79.38 43.645, -79.38 43.65, -79.39 43.65, {junction})))"
+    )
+    build_simplified_geometries(fresh_db.session, ["das"])
+
+    full = _shapes_by_id(client.get("/das").json)
+    response = client.get("/das?zoom=8").json
+    simplified = _shapes_by_id(response)
+    assert len(simplified) == 3
+    assert response["features"][0]["geometry"]["type"] == "MultiPolygon"
+    assert shapely.get_num_coordinates(
+        simplified[bordered.id]
+    ) < shapely.get_num_coordinates(full[bordered.id])
+
+    tier = simplification_tier(LAYERS["das"], tolerance_for_zoom(8))
+    for id, shape in simplified.items():
+        stored = fresh_db.session.execute(
+            select(func.ST_AsGeoJSON(SimplifiedGeometry.geometry, 6)).filter(
+                SimplifiedGeometry.layer == "das",
+                SimplifiedGeometry.tolerance == tier,
+                SimplifiedGeometry.feature_id == id,
+            )
+        ).scalar_one()
+        assert shape.equals_exact(shapely.geometry.shape(json.loads(stored)), 0)
+
+    # the DAs still meet along the edges they share, without gaps or overlaps
+    union = shapely.union_all(list(simplified.values()))
+    assert union.geom_type == "Polygon" and not union.interiors
+    assert sum(shape.area for shape in simplified.values()) == pytest.approx(union.area)
+
+    # layers without tiers always come back in full
+    intersection_model_factory(fresh_db.session).create_batch(2)
+    response = client.get("/intersections?zoom=8")
+    assert len(response.json["features"]) == 2
 
 
 def test_get_budget_arterials(client, fresh_db):
@@ -110,6 +268,50 @@ def test_get_budget_scores(client, fresh_db):
     response = client.get(f"/budgets/{budget.id}/scores")
     assert response.status_code == 200
     assert len(response.json) == 5  # dict w/ 5 keyes
+    assert response.json[str(das[0].id)] == {
+        "da": das[0].id,
+        "scores": {
+            "budget": {"a": 3},
+            "original": {"a": 1},
+            "diff": {"a": 2},
+            "bin": {"a": 1},
+        },
+    }
+
+    response = client.get(f"/budgets/{budget.id + 1}/scores")
+    assert response.json["code"] == 404
+
+    response = client.get(f"/budgets/{budget.id}/scores?format=columnar")
+    assert response.json["da_ids"] == sorted(da.id for da in das)
+    assert response.json["scores"]["budget"]["a"] == [3] * 5
+
+    response = client.get(f"/budgets/{budget.id}/scores?format=binary")
+    assert response.content_type == "application/octet-stream"
+
+    response = client.get(f"/budgets/{budget.id}/scores?format=xml")
+    assert response.json["code"] == 422
+
+
+def test_get_default_scores(client, fresh_db):
+    session = fresh_db.session
+    das = dissemination_area_factory(session).create_batch(2)
+    metric = Metric(name="a")
+    session.add(metric)
+    for i, da in enumerate(das):
+        session.add(BudgetScore(dissemination_area=da, metric=metric, score=i + 0.5))
+    session.commit()
+    refresh_materialized_views(session)
+
+    response = client.get("/default-scores")
+    assert response.status_code == 200
+    assert response.json == {
+        str(da.id): {"a": i + 0.5, "da": da.id} for i, da in enumerate(das)
+    }
+    # compact and with sorted keys, like the other routes
+    assert response.data == client.application.json.response(response.json).data
+
+    response = client.get("/default-scores?format=columnar")
+    assert response.json["da_ids"] == sorted(da.id for da in das)
 
 
 def test_get_intersections(client, fresh_db):
@@ -117,3 +319,394 @@ def test_get_intersections(client, fresh_db):
     response = client.get("/intersections")
     assert response.status_code == 200
     assert len(response.json["features"]) == 10
+
+
+def test_get_tile(client, fresh_db):
+    intersection_model_factory(fresh_db.session).create_batch(2)
+    # the tile at zoom 10 covering the factory's point (-79.531, 43.607)
+    response = client.get("/tiles/intersections/10/285/373.pbf")
+    assert response.status_code == 200
+    assert response.content_type == "application/vnd.mapbox-vector-tile"
+    assert len(response.data) > 0
+
+    empty_response = client.get("/tiles/intersections/10/0/0.pbf")
+    assert empty_response.status_code == 200
+    assert len(empty_response.data) == 0
+
+
+def test_get_tile_unknown_layer(client, fresh_db):
+    response = client.get("/tiles/foo/10/285/373.pbf")
+    assert response.json["code"] == 404
+
+
+def test_conditional_get(client, fresh_db):
+    budget_model_factory(fresh_db.session).create_batch(2)
+    bump_data_version(fresh_db.session)
+
+    response = client.get("/budgets")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.last_modified is not None
+
+    response = client.get("/budgets", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get(
+        "/budgets",
+        headers={"If-Modified-Since": response.headers["Last-Modified"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/budgets", headers={"If-None-Match": '"v0"'})
+    assert response.status_code == 200
+    assert len(response.json) == 2
+
+
+def test_warm_cache(app, client, fresh_db):
+    session = fresh_db.session
+    budgets = budget_model_factory(session).create_batch(2)
+    arterial = arterial_model_factory(session).create()
+    project = project_model_factory(session).create()
+    da = dissemination_area_factory(session).create()
+    metric = Metric(name="a")
+    session.add(metric)
+    session.add(BudgetScore(dissemination_area=da, metric=metric, score=1))
+    for budget in budgets:
+        session.add(
+            BudgetProjectMember(
+                arterial_id=arterial.id, budget_id=budget.id, project_id=project.id
+            )
+        )
+        session.add(
+            BudgetScore(budget=budget, dissemination_area=da, metric=metric, score=2)
+        )
+    session.commit()
+    refresh_materialized_views(session)
+    build_budget_summaries(session)
+
+    results = warm_cache(app)
+
+    paths = [path for path, _, _ in results]
+    assert "/default-scores" in paths
+    for budget in budgets:
+        assert f"/budgets/{budget.id}/arterials" in paths
+        assert f"/budgets/{budget.id}/scores" in paths
+    assert all(status == 200 for _, status, _ in results)
+
+    # the workers are answered from the cache, without running a query
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(fresh_db.engine, "before_cursor_execute", capture)
+    try:
+        for path in paths:
+            assert client.get(path).status_code == 200
+    finally:
+        event.remove(fresh_db.engine, "before_cursor_execute", capture)
+    assert statements == []
+
+
+def test_get_budgets_batch(client, fresh_db):
+    session = fresh_db.session
+    budgets = budget_model_factory(session).create_batch(3)
+    arterial = arterial_model_factory(session).create()
+    project = project_model_factory(session).create()
+    da = dissemination_area_factory(session).create()
+    metric = Metric(name="a")
+    session.add(metric)
+    session.add(
+        BudgetProjectMember(
+            arterial_id=arterial.id, budget_id=budgets[0].id, project_id=project.id
+        )
+    )
+    session.add(BudgetScore(dissemination_area=da, metric=metric, score=1))
+    session.add(
+        BudgetScore(budget=budgets[0], dissemination_area=da, metric=metric, score=2)
+    )
+    session.commit()
+
+    ids = f"{budgets[0].id},{budgets[1].id}"
+
+    response = client.get(f"/budgets/scores?ids={ids}")
+    assert response.json == {
+        str(budgets[0].id): client.get(f"/budgets/{budgets[0].id}/scores").json,
+        str(budgets[1].id): client.get(f"/budgets/{budgets[1].id}/scores").json,
+    }
+    # no stored increase means no change
+    assert response.json[str(budgets[1].id)][str(da.id)]["scores"]["budget"] == {"a": 1}
+
+    response = client.get(f"/budgets/arterials?ids={ids}")
+    assert response.json[str(budgets[0].id)][0]["arterial_id"] == arterial.id
+    assert response.json[str(budgets[1].id)] == []
+
+    response = client.get("/budgets/scores?ids=all")
+    assert len(response.json) == 3
+
+    response = client.get(f"/budgets/arterials?ids={budgets[2].id + 1}")
+    assert response.json["code"] == 404
+
+    response = client.get("/budgets/scores?ids=some")
+    assert response.json["code"] == 422
+
+
+def test_get_budgets_batch_artifact(app, client, fresh_db, tmp_path):
+    budget_model_factory(fresh_db.session).create_batch(2)
+    build_artifacts(fresh_db.session, tmp_path, ["das"])
+    app.config["ARTIFACT_DIR"] = tmp_path
+
+    for route in ["/budgets/scores?ids=all", "/budgets/arterials?ids=all"]:
+        for _ in range(2):
+            response = client.get(route, headers={"Accept-Encoding": "gzip"})
+            assert response.status_code == 200
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert len(json.loads(gzip.decompress(response.data))) == 2
+
+        # the encoding follows each request, it isn't cached along with the route
+        response = client.get(route, headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+        assert len(response.json) == 2
+
+
+def test_get_budget_scores_sparse(client, fresh_db):
+    session = fresh_db.session
+    budget = budget_model_factory(session).create()
+    das = dissemination_area_factory(session).create_batch(3)
+    metric = Metric(name="a")
+    session.add(metric)
+    for da in das:
+        session.add(BudgetScore(dissemination_area=da, metric=metric, score=1))
+    # zero increases aren't stored
+    session.add(
+        BudgetScore(budget=budget, dissemination_area=das[0], metric=metric, score=2)
+    )
+    session.commit()
+
+    response = client.get(f"/budgets/{budget.id}/scores")
+    assert len(response.json) == 3
+
+    response = client.get(f"/budgets/{budget.id}/scores?sparse=true")
+    assert list(response.json["scores"].keys()) == [str(das[0].id)]
+    summary = response.json["summary"]
+    assert summary["da_count"] == 3
+    assert summary["changed_count"] == 1
+    assert summary["metrics"]["a"]["budget"] == {"min": 1, "max": 3, "total": 5}
+
+
+def test_get_budgets_summary(client, fresh_db):
+    session = fresh_db.session
+    budgets = budget_model_factory(session).create_batch(2)
+    arterials = arterial_model_factory(session).create_batch(2, total_length=500)
+    projects = project_model_factory(session).create_batch(2)
+    das = dissemination_area_factory(session).create_batch(3)
+    metric = Metric(name="a")
+    session.add(metric)
+    for arterial in arterials:
+        # an arterial in two of a budget's projects is only counted once
+        for project in projects:
+            session.add(
+                BudgetProjectMember(
+                    arterial_id=arterial.id,
+                    budget_id=budgets[0].id,
+                    project_id=project.id,
+                )
+            )
+    for da in das:
+        session.add(BudgetScore(dissemination_area=da, metric=metric, score=1))
+    session.add(
+        BudgetScore(
+            budget=budgets[0], dissemination_area=das[0], metric=metric, score=2
+        )
+    )
+    session.add(
+        BudgetScore(
+            budget=budgets[0], dissemination_area=das[1], metric=metric, score=3
+        )
+    )
+    session.commit()
+
+    build_budget_summaries(session)
+
+    response = client.get("/budgets/summary")
+    assert response.status_code == 200
+    assert response.json[str(budgets[0].id)] == {
+        "name": budgets[0].name,
+        "arterial_count": 2,
+        "arterial_km": 1,
+        "das_improved": 2,
+        "metrics": {"a": {"total_increase": 5, "das_improved": 2}},
+    }
+    assert response.json[str(budgets[1].id)]["arterial_count"] == 0
+    assert response.json[str(budgets[1].id)]["metrics"]["a"] == {
+        "total_increase": 0,
+        "das_improved": 0,
+    }
+
+
+def test_get_accessibility_body(app, client, fresh_db, monkeypatch):
+    session = fresh_db.session
+    das = dissemination_area_factory(session)
+    tiny, large, unscored = [das.create(origin_id=id) for id in (1, 2, 3)]
+    metric = Metric(name="job")
+    session.add(metric)
+    for da, score in [(tiny, 1e-05), (large, 1.0), (unscored, 2.0)]:
+        session.add(BudgetScore(dissemination_area=da, metric=metric, score=score))
+    session.commit()
+
+    def engine(project_ids, metrics):
+        return {"job": {1: 0.0, 2: 1e16, 3: float("nan")}, "populations": {}}
+
+    monkeypatch.setattr(api.app, "calculate_accessibility", engine)
+    monkeypatch.setattr(
+        api.app, "accessibility_cache", AccessibilityCache(SimpleCache(), 4)
+    )
+
+    response = client.get("/accessibility?project_ids=1")
+
+    # what `jsonify` wrote for the same scores before the orjson provider
+    expected = {
+        str(tiny.id): {
+            "da": tiny.id,
+            "scores": {
+                "bin": {"job": 0},
+                "budget": {"job": 1e-05},
+                "diff": {"job": 0},
+                "original": {"job": 1e-05},
+            },
+        },
+        str(large.id): {
+            "da": large.id,
+            "scores": {
+                "bin": {"job": 1},
+                "budget": {"job": 1e16},
+                "diff": {"job": 10**16},
+                "original": {"job": 1.0},
+            },
+        },
+    }
+    # a NaN score leaves its DA out, and the bytes differ only in how floats that
+    # print with an exponent are written, see `OrjsonProvider`
+    assert response.json == expected
+    assert response.data == DefaultJSONProvider(app).response(expected).data.replace(
+        b"1e-05", b"0.00001"
+    ).replace(b"1e+16", b"1e16")
+
+
+def _square(lon: float, lat: float, size: float = 0.001):
+    corners = [
+        (lon, lat),
+        (lon + size, lat),
+        (lon + size, lat + size),
+        (lon, lat + size),
+    ]
+    return (
+        f"MULTIPOLYGON ((({', '.join(f'{x} {y}' for x, y in corners + corners[:1])})))"
+    )
+
+
+def test_get_accessibility_from_nearby_set(app, client, fresh_db, monkeypatch):
+    session = fresh_db.session
+    projects = project_model_factory(session).create_batch(2)
+    arterials = arterial_model_factory(session)
+    # one project by the first DA, the other across town by the second
+    arterials.create(default_project_id=projects[0].id)
+    arterials.create(
+        default_project_id=projects[1].id,
+        geometry="LINESTRING (-79.2 43.8, -79.201 43.8)",
+    )
+    das = dissemination_area_factory(session)
+    near_first = das.create(origin_id=1, geometry=_square(-79.401, 43.644))
+    near_second = das.create(origin_id=2, geometry=_square(-79.2, 43.801))
+    neither = das.create(origin_id=3, geometry=_square(-79.3, 43.72))
+    metric = Metric(name="job")
+    session.add(metric)
+    for da in [near_first, near_second, neither]:
+        session.add(BudgetScore(dissemination_area=da, metric=metric, score=1))
+    session.commit()
+
+    # an engine whose origins only gain from the projects within reach of them
+    in_reach = {projects[0].id: {1}, projects[1].id: {2}}
+    calls = []
+
+    def engine(project_ids, metrics, origin_ids=None):
+        calls.append(origin_ids)
+        origins = [1, 2, 3] if origin_ids is None else origin_ids
+        return {
+            metric: {
+                origin: 1.0 + sum(origin in in_reach[id] for id in project_ids)
+                for origin in origins
+            }
+            for metric in metrics
+        }
+
+    monkeypatch.setattr(api.app, "calculate_accessibility", engine)
+    app.config["ACCESSIBILITY_REACH_METERS"] = 1000.0
+
+    both = f"{projects[0].id},{projects[1].id}"
+
+    monkeypatch.setattr(
+        api.app, "accessibility_cache", AccessibilityCache(SimpleCache(), 4)
+    )
+    client.get(f"/accessibility?project_ids={projects[0].id}")
+    derived = client.get(
+        f"/accessibility?project_ids={both}&base_project_ids={projects[0].id}"
+    )
+    # only the origin in reach of the added project was recomputed
+    assert sorted(calls[1]) == [2]
+
+    monkeypatch.setattr(
+        api.app, "accessibility_cache", AccessibilityCache(SimpleCache(), 4)
+    )
+    full = client.get(f"/accessibility?project_ids={both}")
+    assert calls[2] is None
+
+    assert derived.status_code == 200
+    assert derived.json == full.json
+    # the added project did change the scores
+    assert full.json != client.get(f"/accessibility?project_ids={projects[0].id}").json
+
+
+def test_reach_needs_engine_taking_origins(monkeypatch):
+    monkeypatch.setattr(api.app.app_settings, "ACCESSIBILITY_REACH_METERS", 1000.0)
+
+    def engine(project_ids, metrics):
+        return {metric: {} for metric in metrics}
+
+    monkeypatch.setattr(api.app, "calculate_accessibility", engine)
+    with pytest.raises(RuntimeError, match="origin_ids"):
+        api.app.create_app(testing=True)
+
+    monkeypatch.setattr(
+        api.app,
+        "calculate_accessibility",
+        lambda project_ids, metrics, origin_ids=None: engine(project_ids, metrics),
+    )
+    assert api.app.create_app(testing=True).config["ACCESSIBILITY_REACH_METERS"]
+
+
+def test_get_accessibility_ignores_base_without_reach(
+    app, client, fresh_db, monkeypatch
+):
+    projects = project_model_factory(fresh_db.session).create_batch(2)
+    calls = []
+
+    def engine(project_ids, metrics, origin_ids=None):
+        calls.append(origin_ids)
+        return {metric: {} for metric in metrics}
+
+    monkeypatch.setattr(api.app, "calculate_accessibility", engine)
+    monkeypatch.setattr(
+        api.app, "accessibility_cache", AccessibilityCache(SimpleCache(), 4)
+    )
+    app.config["ACCESSIBILITY_REACH_METERS"] = None
+
+    client.get(f"/accessibility?project_ids={projects[0].id}")
+    response = client.get(
+        f"/accessibility?project_ids={projects[0].id},{projects[1].id}"
+        f"&base_project_ids={projects[0].id}"
+    )
+    assert response.status_code == 200
+    # both sets were computed in full
+    assert calls == [None, None]
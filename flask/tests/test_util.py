@@ -1,10 +1,48 @@
+import json
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import math
+import os
+import random
+from socket import gethostname
+import subprocess
+from threading import Barrier, Event
+import time
+
+from cachelib import SimpleCache
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 import geopandas
+import numpy as np
+import pytest
 from sqlalchemy import select
 
+from api.accessibility import (
+    ACCESSIBILITY_METRICS,
+    AccessibilityCache,
+    merge_recomputed,
+    takes_origin_ids,
+    toggled_project,
+)
+from api.compute_context import load_compute_context
+from api.jobs import DONE, FAILED, PENDING, AccessibilityJobs
+from api.json_provider import OrjsonProvider
+from api.layers import (
+    LAYERS,
+    SIMPLIFICATION_TOLERANCES,
+    simplification_tier,
+    tolerance_for_zoom,
+)
 from api.models import Arterial
+from api.scores import ScoreCube, changed_das, summarize
+from api.summaries import summarize_increases
+from api.topojson import topology
 from api.utils import model_to_dict, properties_to_geojson_features, DaScoreResult
 from tests.factories import (
     arterial_model_factory,
+    dissemination_area_factory,
 )
 
 
@@ -45,3 +83,559 @@ def test_da_score_result():
     assert score_block["scores"]["budget"][metric] == 13
     assert score_block["scores"]["diff"][metric] == 10
     assert score_block["scores"]["original"][metric] == 3
+
+
+def test_da_score_result_vectors():
+    scores = DaScoreResult([3, 1])
+    scores.add_metric_vector(
+        metric="foo", da_ids=[1, 3], scores=[2.5, 0], base_scores=[1, 4]
+    )
+    # DAs that weren't preallocated are added
+    scores.add_metric_vector(
+        metric="bar",
+        da_ids=list(range(100, 140)),
+        scores=np.arange(40.0),
+        base_scores=np.ones(40),
+    )
+    scores.add_da_metric(da_id=3, metric="bar", score=1.5, base_score=2)
+
+    expected = DaScoreResult()
+    expected.add_da_metric(da_id=1, metric="foo", score=2.5, base_score=1)
+    expected.add_da_metric(da_id=3, metric="foo", score=0, base_score=4)
+    expected.add_da_metric(da_id=3, metric="bar", score=1.5, base_score=2)
+    for i in range(40):
+        expected.add_da_metric(da_id=100 + i, metric="bar", score=i, base_score=1)
+
+    results = scores.to_dict()
+    assert results == expected.to_dict()
+    assert results["1"]["scores"] == {
+        "budget": {"foo": 3.5},
+        "original": {"foo": 1},
+        "diff": {"foo": 2},
+        "bin": {"foo": 1},
+    }
+
+
+def test_score_cube_matches_da_score_result():
+    # budget 2 has no score for the second DA, the first metric has no baseline for the third
+    values = np.array(
+        [
+            [[3.0, 1.5, np.nan], [0.5, 2.0, 4.0]],
+            [[10.0, 0.5, 1.0], [0.25, 7.5, 1.0]],
+            [[2.0, np.nan, 1.0], [1.0, np.nan, 3.0]],
+        ]
+    )
+    cube = ScoreCube(
+        budget_ids=[None, 1, 2],
+        metrics=["foo", "bar"],
+        da_ids=np.array([4, 5, 6]),
+        values=values,
+    )
+
+    for budget_index, budget_id in [(1, 1), (2, 2)]:
+        expected = DaScoreResult()
+        for m, metric in enumerate(cube.metrics):
+            for d, da_id in enumerate(cube.da_ids):
+                score, base_score = values[budget_index, m, d], values[0, m, d]
+                if not np.isnan(score) and not np.isnan(base_score):
+                    expected.add_da_metric(
+                        da_id=int(da_id),
+                        metric=metric,
+                        score=float(score),
+                        base_score=float(base_score),
+                    )
+        assert cube.budget_dict(budget_id) == expected.to_dict()
+
+    assert cube.baseline_dict()[6] == {"bar": 4.0, "da": 6}
+    assert cube.budget_columns(2).da_ids.tolist() == [4, 6]
+    np.testing.assert_equal(cube.baseline_scores("bar", [6, 4, 99]), [4.0, 0.5, np.nan])
+    assert cube.baseline_columns().to_columnar()["scores"]["original"]["foo"] == [
+        3.0,
+        1.5,
+        None,
+    ]
+    assert not cube.has_budget(3)
+
+
+def test_score_columns():
+    scores = DaScoreResult()
+    scores.add_da_metric(da_id=7, metric="foo", score=10.5, base_score=3)
+    scores.add_da_metric(da_id=2, metric="foo", score=1, base_score=3)
+    scores.add_da_metric(da_id=2, metric="bar", score=4, base_score=0.5)
+
+    columns = scores.to_columns()
+
+    columnar = columns.to_columnar()
+    assert columnar["da_ids"] == [2, 7]
+    assert columnar["metrics"] == ["bar", "foo"]
+    assert columnar["scores"]["budget"] == {"bar": [4.5, None], "foo": [4, 13.5]}
+    assert columnar["scores"]["diff"] == {"bar": [4, None], "foo": [1, 10]}
+    assert columnar["scores"]["bin"] == {"bar": [1, None], "foo": [0, 1]}
+
+    body = columns.to_binary()
+    (header_length,) = struct.unpack_from("<I", body)
+    header = json.loads(body[4 : 4 + header_length])
+    assert header == {
+        "da_count": 2,
+        "metrics": ["bar", "foo"],
+        "score_types": ["budget", "original", "diff", "bin"],
+    }
+    offset = 4 + header_length
+    assert offset % 4 == 0
+    assert np.frombuffer(body, "<i4", 2, offset).tolist() == [2, 7]
+    values = np.frombuffer(body, "<f4", offset=offset + 8).reshape(4, 2, 2)
+    assert values[0].tolist()[1] == [4, 13.5]
+    assert np.isnan(values[3, 0, 1])
+
+
+def test_sparse_scores():
+    scores = DaScoreResult()
+    scores.add_da_metric(da_id=1, metric="foo", score=0, base_score=3)
+    scores.add_da_metric(da_id=1, metric="bar", score=0, base_score=1)
+    scores.add_da_metric(da_id=2, metric="foo", score=0, base_score=2)
+    scores.add_da_metric(da_id=2, metric="bar", score=0.5, base_score=1)
+
+    columns = scores.to_columns()
+
+    # a change that rounds to a diff of 0 still counts
+    assert changed_das(columns).to_dict() == {"2": scores.to_dict()["2"]}
+
+    summary = summarize(columns)
+    assert summary["da_count"] == 2
+    assert summary["changed_count"] == 1
+    assert summary["metrics"]["bar"]["budget"] == {"min": 1, "max": 1.5, "total": 2.5}
+    assert summary["metrics"]["foo"]["bin"] == {"min": 0, "max": 0, "total": 0}
+
+
+def test_summarize_increases():
+    scores = DaScoreResult()
+    scores.add_da_metric(da_id=1, metric="foo", score=2, base_score=3)
+    scores.add_da_metric(da_id=1, metric="bar", score=0, base_score=1)
+    scores.add_da_metric(da_id=2, metric="foo", score=0.5, base_score=2)
+    scores.add_da_metric(da_id=3, metric="bar", score=0, base_score=1)
+
+    assert summarize_increases(scores.to_columns()) == {
+        "das_improved": 2,
+        "metrics": {
+            "bar": {"total_increase": 0, "das_improved": 0},
+            "foo": {"total_increase": 2.5, "das_improved": 2},
+        },
+    }
+
+
+def test_orjson_provider():
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    payload = {"b": [1.5, 2, None, "é"], "a": {"y": 0.1 + 0.2, "x": np.float64(3.25)}}
+
+    with app.app_context():
+        # the same body flask's default provider writes
+        assert (
+            app.json.response(payload).data
+            == DefaultJSONProvider(app).response(payload).data
+        )
+        # bar floats that print with an exponent, which decode to the same values
+        floats = [1e-05, 1e16, 1.2345e-07, 0.0001]
+        assert app.json.dumps(floats) == "[0.00001,1e16,1.2345e-7,0.0001]"
+        assert json.loads(app.json.dumps(floats)) == floats
+        # and int keys, which are sorted as strings
+        assert app.json.dumps({10: 1, 9: 2}) == '{"10":1,"9":2}'
+        assert app.json.loads(app.json.dumps(payload)) == payload
+        # numpy arrays are encoded natively and NaN as null
+        assert app.json.dumps({1: np.array([1.0, np.nan])}) == '{"1":[1.0,null]}'
+
+        app.json.float_precision = 2
+        assert app.json.loads(app.json.dumps(payload))["a"] == {"x": 3.25, "y": 0.3}
+        assert app.json.dumps(np.array([1.23456])) == "[1.23]"
+
+
+def test_simplification_tier():
+    das = LAYERS["das"]
+
+    # zoomed all the way in we want the full geometry
+    assert simplification_tier(das, tolerance_for_zoom(18)) is None
+    assert simplification_tier(das, None) is None
+    # zoomed out we want the coarsest tier
+    assert simplification_tier(das, tolerance_for_zoom(5)) == max(
+        SIMPLIFICATION_TOLERANCES
+    )
+    # never coarser than asked for
+    assert simplification_tier(das, 0.0005) == 0.0004
+    # layers without tiers are always full
+    assert simplification_tier(LAYERS["arterials"], 1) is None
+
+
+def _decode_ring(ring_arcs, arcs):
+    """Stitch a ring back together from its (delta-encoded) arcs"""
+    points = []
+    for index in ring_arcs:
+        arc = arcs[index if index >= 0 else ~index]
+        x, y = 0, 0
+        decoded = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            decoded.append((x, y))
+        if index < 0:
+            decoded.reverse()
+        points.extend(decoded if not points else decoded[1:])
+    return points
+
+
+def test_topology_shares_boundaries():
+    def square(x0, y0, x1, y1):
+        return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"id": 1},
+            "geometry": {"type": "Polygon", "coordinates": [square(0, 0, 1, 1)]},
+        },
+        {
+            "type": "Feature",
+            "properties": {"id": 2},
+            "geometry": {"type": "MultiPolygon", "coordinates": [[square(1, 0, 2, 1)]]},
+        },
+    ]
+
+    # a 3x3 grid over a 2x1 extent, so quantized points are the original coordinates
+    result = topology(features, "das", quantization=3)
+
+    assert result["transform"] == {"scale": [1, 0.5], "translate": [0, 0]}
+
+    # the shared edge is stored once, plus the rest of each square
+    assert len(result["arcs"]) == 3
+
+    geometries = result["objects"]["das"]["geometries"]
+    assert [g["properties"]["id"] for g in geometries] == [1, 2]
+
+    for feature, geometry in zip(features, geometries):
+        coordinates = feature["geometry"]["coordinates"]
+        exterior = (
+            coordinates[0]
+            if feature["geometry"]["type"] == "Polygon"
+            else coordinates[0][0]
+        )
+        expected = [(x, y * 2) for x, y in exterior[:-1]]
+
+        decoded = _decode_ring(geometry["arcs"][0][0], result["arcs"])
+        assert decoded[0] == decoded[-1]
+        # same ring, possibly starting elsewhere
+        start = expected.index(decoded[0])
+        assert decoded[:-1] == expected[start:] + expected[:start]
+
+
+def test_accessibility_cache():
+    calls = []
+
+    def compute(project_ids):
+        calls.append(project_ids)
+        return {"job": {1: float(sum(project_ids))}}
+
+    store = SimpleCache()
+    cache = AccessibilityCache(store, max_entries=2)
+
+    assert cache.get([3, 1, 2], 1, compute) == {"job": {1: 6.0}}
+    # the same set in any order is a hit, and the computation got the sorted ids
+    assert cache.get([1, 2, 3, 3], 1, compute) == {"job": {1: 6.0}}
+    assert calls == [[1, 2, 3]]
+
+    # a new data version is computed afresh
+    cache.get([1, 2, 3], 2, compute)
+    assert len(calls) == 2
+
+    # another worker finds the results in the shared store
+    other = AccessibilityCache(store, max_entries=2)
+    other.get([1, 2, 3], 1, compute)
+    assert len(calls) == 2
+    assert other.stats()["disk_hits"] == 1
+
+    # the least recently used entry is evicted from memory, but not from the store
+    cache.get([4], 1, compute)
+    cache.get([1, 2, 3], 1, compute)
+    assert len(calls) == 3
+    assert cache.stats() == {
+        "memory_hits": 1,
+        "disk_hits": 1,
+        "misses": 3,
+        "coalesced": 0,
+        "entries": 2,
+        "max_entries": 2,
+    }
+
+
+def test_accessibility_cache_coalesces(tmp_path):
+    calls = []
+    barrier = Barrier(4)
+
+    def compute(project_ids):
+        calls.append(project_ids)
+        # long enough for every request to arrive while it runs
+        time.sleep(0.2)
+        return {"job": {1: 1.0}}
+
+    store = SimpleCache()
+    # two workers, sharing the store and the lock files
+    workers = [
+        AccessibilityCache(store, max_entries=2, lock_dir=str(tmp_path))
+        for _ in range(2)
+    ]
+
+    def request(cache):
+        barrier.wait()
+        return cache.get([1, 2], 1, compute)
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(request, workers * 2))
+
+    assert calls == [[1, 2]]
+    assert all(result == {"job": {1: 1.0}} for result in results)
+    stats = [cache.stats() for cache in workers]
+    assert sum(s["misses"] for s in stats) == 4
+    assert sum(s["coalesced"] for s in stats) == 3
+
+
+def test_accessibility_jobs():
+    def compute(project_ids, metrics):
+        if not project_ids:
+            raise ValueError("no projects")
+        return {metric: {1: float(len(project_ids))} for metric in metrics}
+
+    cache = AccessibilityCache(SimpleCache(), max_entries=2)
+    jobs = AccessibilityJobs(cache, executor=ThreadPoolExecutor(1))
+    job = jobs.submit([2, 1], 1, compute, ["job"])
+    failed = jobs.submit([], 1, compute, ["job"])
+    jobs.shutdown()
+
+    # any worker sharing the store sees the outcome
+    others = AccessibilityJobs(AccessibilityCache(cache.store, max_entries=2))
+    assert others.get(job["id"])["status"] == DONE
+    assert others.results.lookup([1, 2], 1) == {"job": {1: 2.0}}
+    assert others.get(failed["id"])["status"] == FAILED
+    assert others.get("unknown") is None
+
+    # cached results don't go to the pool at all
+    assert jobs.submit([1, 2], 1, compute, ["job"])["status"] == DONE
+    # and neither submits nor checks on the results count in the stats
+    for stats in [cache.stats(), others.results.stats()]:
+        assert stats["memory_hits"] == stats["disk_hits"] == stats["misses"] == 0
+
+    # a set that's already being computed gets the job that's computing it
+    executor = ThreadPoolExecutor(1)
+    jobs = AccessibilityJobs(cache, executor=executor)
+    executor.submit(time.sleep, 0.2)
+    first = jobs.submit([3], 1, compute, ["job"])
+    second = jobs.submit([3], 1, compute, ["job"])
+    assert second["id"] == first["id"]
+    assert jobs.stats() == {"coalesced": 1}
+    jobs.shutdown()
+    assert jobs.get(first["id"])["status"] == DONE
+    # coalesced submits aren't counted as coalesced lookups
+    assert cache.stats()["coalesced"] == 0
+
+    # a job whose worker exited never finishes, so it's failed and not shared
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    jobs = AccessibilityJobs(cache, executor=ThreadPoolExecutor(1))
+    orphan = {"id": "orphan", "status": PENDING, "project_ids": [4], "version": 1}
+    jobs._save({**orphan, "owner": [gethostname(), exited.pid]})
+    cache.store.set(jobs.pending_key([4], 1), "orphan")
+    assert jobs.get("orphan")["status"] == FAILED
+    assert jobs.submit([4], 1, compute, ["job"])["id"] != "orphan"
+    jobs.shutdown()
+
+
+def test_accessibility_job_shares_synchronous_computation():
+    computing = Event()
+    calls = []
+
+    def compute(project_ids, metrics):
+        calls.append(project_ids)
+        computing.set()
+        time.sleep(0.2)
+        return {metric: {1: 1.0} for metric in metrics}
+
+    cache = AccessibilityCache(SimpleCache(), max_entries=2)
+    jobs = AccessibilityJobs(cache, executor=ThreadPoolExecutor(1))
+    job = jobs.submit([1], 1, compute, ["job"])
+
+    # a request for the set the job is computing waits for it rather than computing too
+    computing.wait()
+    assert cache.get([1], 1, lambda ids: compute(ids, ["job"])) == {"job": {1: 1.0}}
+    jobs.shutdown()
+
+    assert calls == [[1]]
+    assert jobs.get(job["id"])["status"] == DONE
+    assert cache.stats()["coalesced"] == 1
+
+
+# the processes of a job pool run these, so they have to be importable
+_initialized_in = []
+
+
+def _initialize_worker():
+    _initialized_in.append(os.getpid())
+
+
+def _compute_in_initialized_worker(project_ids, metrics):
+    # 1 where this process ran the initializer, once
+    return {metric: {1: float(_initialized_in == [os.getpid()])} for metric in metrics}
+
+
+def test_accessibility_job_pool_initializer():
+    cache = AccessibilityCache(SimpleCache(), max_entries=2)
+    jobs = AccessibilityJobs(cache, max_workers=1, initializer=_initialize_worker)
+    jobs.start()
+    job = jobs.submit([1], 1, _compute_in_initialized_worker, ["job"])
+    second = jobs.submit([2], 1, _compute_in_initialized_worker, ["job"])
+    jobs.shutdown()
+
+    assert jobs.get(job["id"])["status"] == jobs.get(second["id"])["status"] == DONE
+    assert cache.lookup([1], 1) == cache.lookup([2], 1) == {"job": {1: 1.0}}
+    # the pool was started ahead of the jobs, in the parent it's never run
+    assert _initialized_in == []
+
+
+def test_incremental_accessibility_matches_full():
+    # a toy engine: a street grid where a project's edges take half as long to ride,
+    # scoring each origin by the destinations it reaches within a time limit
+    size, limit = 8, 3.0
+    nodes = [(x, y) for x in range(size) for y in range(size)]
+    edges = {
+        (node, (node[0] + dx, node[1] + dy))
+        for node in nodes
+        for dx, dy in [(1, 0), (0, 1)]
+        if node[0] + dx < size and node[1] + dy < size
+    }
+    projects = {
+        1: {((x, 1), (x + 1, 1)) for x in range(3)},
+        2: {((6, y), (6, y + 1)) for y in range(4, 7)},
+        3: {((3, y), (3, y + 1)) for y in range(2, 5)},
+        4: {((x, 6), (x + 1, 6)) for x in range(1, 3)},
+    }
+    jobs = {node: (node[0] * 7 + node[1] * 3) % 5 for node in nodes}
+
+    def engine(project_ids, metrics, origin_ids=None):
+        upgraded = set().union(*(projects[id] for id in project_ids))
+        graph = {node: [] for node in nodes}
+        for a, b in edges:
+            cost = 1.0 if (a, b) in upgraded else 2.0
+            graph[a].append((b, cost))
+            graph[b].append((a, cost))
+
+        def reachable(origin):
+            times = {origin: 0.0}
+            queue = [(0.0, origin)]
+            while queue:
+                time, node = heapq.heappop(queue)
+                for neighbour, cost in graph[node]:
+                    if time + cost <= limit and time + cost < times.get(
+                        neighbour, math.inf
+                    ):
+                        times[neighbour] = time + cost
+                        heapq.heappush(queue, (time + cost, neighbour))
+            return times
+
+        origins = range(len(nodes)) if origin_ids is None else origin_ids
+        scores = {origin: reachable(nodes[origin]) for origin in origins}
+        return {
+            "job": {o: float(sum(jobs[n] for n in r)) for o, r in scores.items()},
+            "populations": {o: float(len(r)) for o, r in scores.items()},
+        }
+
+    def affected(project_id):
+        # a ride is never shorter than the distance covered, so only origins within
+        # the limit of a project's edges can use them
+        ends = {end for edge in projects[project_id] for end in edge}
+        return [
+            origin
+            for origin, node in enumerate(nodes)
+            if any(math.dist(node, end) <= limit for end in ends)
+        ]
+
+    metrics = ["job", "populations"]
+    cache = AccessibilityCache(SimpleCache(), max_entries=4)
+    full, recomputed = [], []
+    rng = random.Random(0)
+    project_ids = []
+
+    for _ in range(30):
+        # like a client toggling one project at a time, passing the set it had before
+        previous = project_ids
+        project_ids = sorted(set(project_ids) ^ {rng.choice(list(projects))})
+
+        def compute(ids):
+            nearby = cache.nearby(ids, 1, previous)
+            if nearby is None:
+                full.append(ids)
+                return engine(ids, metrics)
+            nearby_ids, base = nearby
+            origin_ids = affected(toggled_project(nearby_ids, ids))
+            recomputed.append(len(origin_ids))
+            return merge_recomputed(base, origin_ids, engine(ids, metrics, origin_ids))
+
+        assert cache.get(project_ids, 1, compute) == engine(project_ids, metrics)
+
+    # only the first set was computed in full, the others from fewer origins
+    assert len(full) == 1
+    assert recomputed and max(recomputed) < len(nodes)
+    # results of another data version aren't used
+    assert cache.nearby(project_ids, 2) is None
+    assert toggled_project([1, 2], [2, 3]) is None
+    assert toggled_project([2, 1], [1]) == 2
+
+
+def test_engine_computes_origin_subsets():
+    # incremental recomputation relies on the real engine scoring a subset of origins
+    # the same as it does in a full run
+    engine = pytest.importorskip("cycle_calc.calculate_accessibility").main
+    if not takes_origin_ids(engine):
+        pytest.skip("the accessibility engine doesn't take origin_ids")
+
+    # the first projects of the engine's network, see tests/fixtures/proj2artid.pkl
+    project_ids = [0, 1, 2]
+    full = engine(project_ids, ACCESSIBILITY_METRICS)
+    base = engine(project_ids[:-1], ACCESSIBILITY_METRICS)
+
+    origin_ids = sorted(full["job"])[::50]
+    assert engine(project_ids, ACCESSIBILITY_METRICS, origin_ids=origin_ids) == {
+        metric: {origin: scores[origin] for origin in origin_ids}
+        for metric, scores in full.items()
+    }
+
+    changed = [
+        origin
+        for origin in full["job"]
+        if any(base[metric].get(origin) != full[metric][origin] for metric in full)
+    ]
+    recomputed = engine(project_ids, ACCESSIBILITY_METRICS, origin_ids=changed)
+    assert merge_recomputed(base, changed, recomputed) == full
+
+
+def test_compute_context(app_ctx, fresh_db):
+    das = dissemination_area_factory(fresh_db.session)
+    with_baseline, without_baseline = das.create(origin_id=30), das.create(origin_id=10)
+    das.create(origin_id=None)
+
+    cube = ScoreCube(
+        budget_ids=[None],
+        metrics=["job"],
+        da_ids=np.array([with_baseline.id]),
+        values=np.array([[[4.0]]]),
+    )
+    context = load_compute_context(fresh_db.session, 1, cube)
+
+    positions, found = context.lookup(np.array([30, 99, 10]))
+    assert found.tolist() == [True, False, True]
+    assert context.da_ids[positions[found]].tolist() == [
+        with_baseline.id,
+        without_baseline.id,
+    ]
+    np.testing.assert_array_equal(
+        context.baseline_scores("job", positions[found]), [4.0, np.nan]
+    )
+    assert np.isnan(context.baseline_scores("unknown", positions[found])).all()
+
+    # shared between the workers, so nothing may write to it
+    assert not context.baseline.flags.writeable
+    assert not context.origin_ids.flags.writeable
@@ -53,3 +53,15 @@ docker compose -f "${compose_file}" run --rm \
     -v ${DATA_DIR}/cycling-network.geojson:/tmp/upload.geojson \
     --entrypoint="python /code/scripts/import_existing_lanes.py --geojson_path /tmp/upload.geojson" \
     flask
+
+docker compose -f "${compose_file}" run --rm \
+    --entrypoint="python /code/scripts/simplify_geometries.py" \
+    flask
+
+docker compose -f "${compose_file}" run --rm \
+    --entrypoint="python /code/scripts/build_artifacts.py" \
+    flask
+
+docker compose -f "${compose_file}" run --rm \
+    --entrypoint="python /code/scripts/warm_cache.py" \
+    flask
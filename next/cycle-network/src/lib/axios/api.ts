@@ -6,11 +6,45 @@ export const client = axios.create({
   timeout: 1000000,
 });
 
+interface AccessibilityJob {
+  id: string;
+  status: string;
+}
+
+// the api sends its errors with a 200
+interface ApiError {
+  code: number;
+  description: string;
+}
+
+// how long to wait between checks on a running accessibility job
+const JOB_POLL_INTERVAL_MS = 1000;
+
 export const fetchImprovements = (budgetId: number) =>
   client.get<BudgetProjectMember>(`budgets/${budgetId}/arterials`);
 
 export const fetchBudgetScores = (budgetId: number) =>
   client.get<ScoreResults>(`budgets/${budgetId}/scores`);
 
-export const fetchNewCalculations = (projectIds: number[]) =>
-  client.get<ScoreResults>(`accessibility?project_ids=${projectIds.join(",")}`);
+// computed as a job, so no api worker is held up for the whole computation
+export const fetchNewCalculations = async (projectIds: number[]) => {
+  const job = await client.post<AccessibilityJob | ApiError>(
+    `accessibility/jobs?project_ids=${projectIds.join(",")}`
+  );
+  if ("code" in job.data) {
+    throw new Error(job.data.description);
+  }
+
+  for (;;) {
+    const response = await client.get<
+      ScoreResults | AccessibilityJob | ApiError
+    >(`accessibility/jobs/${job.data.id}`);
+    if ("code" in response.data && "description" in response.data) {
+      throw new Error(String(response.data.description));
+    }
+    if (response.status !== 202) {
+      return { ...response, data: response.data as ScoreResults };
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};